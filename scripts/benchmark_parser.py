@@ -0,0 +1,52 @@
+# Time the line-based screenplay parser against the original regex implementation
+# on a directory of screenplay .txt files, and check that they agree
+
+from hannstats import utils
+from argparse import ArgumentParser
+import pandas as pd
+import os
+import time
+
+
+def _regex_dialog_table(screenplay):
+    screenplay = utils._clean_screenplay_regex(screenplay)
+    data = utils._get_candidates_regex(screenplay)
+    return pd.DataFrame(data)
+
+
+def _time(parse, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frames = [parse(t) for t in texts]
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, frames
+
+
+def main():
+    parser = ArgumentParser()
+
+    parser.add_argument("scriptsdir", help="Directory where the screenplay .txt files are stored")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of timing runs, best is reported")
+
+    args = parser.parse_args()
+
+    sp_files = sorted(os.path.join(args.scriptsdir, f) for f in os.listdir(args.scriptsdir) if f[-4:] == '.txt')
+    sp_texts = utils.load_texts(sp_files)
+
+    old_time, old_frames = _time(_regex_dialog_table, sp_texts, args.repeat)
+    new_time, new_frames = _time(utils.screenplay_to_dialog_table, sp_texts, args.repeat)
+
+    mismatches = [path for path, a, b in zip(sp_files, old_frames, new_frames) if not a.equals(b)]
+    for path in mismatches:
+        print(f"Output differs for {path}")
+
+    print(f"{len(sp_texts)} screenplays")
+    print(f"regex parser: {old_time:.3f}s")
+    print(f"line parser:  {new_time:.3f}s ({old_time / new_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,7 @@
 # This is where I build the character networks!
 from argparse import ArgumentParser
-import networkx as nx
-import pandas as pd
-from pyvis.network import Network
 import os, json
-from hannstats import utils
+from hannstats import network, cache, render
 
 _SCRIPT_DIR = os.path.dirname(__file__)
 _CHAR_BINS = os.path.join(_SCRIPT_DIR, "..", "character_bins.json")
@@ -15,20 +12,25 @@ def main():
     parser.add_argument("-n", "--novels", help="Folder with network files for novels", required=True)
     parser.add_argument("-s", "--screenplays", help="Folder with network files for screenplays", required=True)
     parser.add_argument("-f", "--fanfic", help="Folder with network files for fanfic", required=True)
+    parser.add_argument("--min-weight", type=int, default=10, help="Drop combined edges lighter than this")
+    parser.add_argument("--top-k", type=int, default=None, help="Keep only the k heaviest combined edges")
+    parser.add_argument("--cache", help="Directory to cache combined networks in, so unchanged folders are not read again")
+    parser.add_argument("--backbone", type=float, default=None,
+                        help="Only draw the disparity filter backbone at this significance level (e.g. 0.05)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the network layout")
+    parser.add_argument("-o", "--out", default="example.html", help="Where to write the network page")
 
     args = parser.parse_args()
 
-    n_paths = [os.path.join(args.novels, file) for file in os.listdir(args.novels)]
-    s_paths = [os.path.join(args.screenplays, file) for file in os.listdir(args.screenplays)]
-    f_paths = [os.path.join(args.fanfic, file) for file in os.listdir(args.fanfic)]
+    # Sum each corpus' edges across files, counting A-B and B-A as one edge. Cached results are keyed
+    # on each folder's file listing (names, sizes, modification times), so a hit reads none of the files.
+    aggregate = network.aggregate_networks
+    if args.cache:
+        aggregate = cache.cached(aggregate, args.cache, by_stat=True)
 
-    n_frames = [pd.read_csv(np, sep='\t') for np in n_paths]
-    f_frames = [pd.read_csv(fp, sep='\t') for fp in f_paths]
-    s_frames = [pd.read_csv(sp, sep='\t') for sp in s_paths]
-
-    n_corp = pd.concat(n_frames)
-    f_corp = pd.concat(f_frames)
-    s_corp = pd.concat(s_frames)
+    n_corp = aggregate(args.novels)
+    f_corp = aggregate(args.fanfic)
+    s_corp = aggregate(args.screenplays)
     print(s_corp)
 
     df = f_corp
@@ -36,17 +38,17 @@ def main():
         cbins = json.load(fp)
     #df = df[(df['source'].isin(cbins)) & (df['target'].isin(cbins))]
 
-    df = df[df['weight']>=10]
-    G = nx.from_pandas_edgelist(df,
-                                source="source",
-                                target="target",
-                                edge_attr="weight")
+    df = network.prune(df, min_weight=args.min_weight, top_k=args.top_k)
+    if args.backbone is not None:
+        df = render.disparity_filter(df, alpha=args.backbone)
 
-    net = Network(height='100%', width='100%', bgcolor='#222222', font_color='white')
-    net.from_nx(G)
-    net.barnes_hut()
+    # The layout is worked out here rather than in the browser, and kept next to the network it
+    # belongs to so that redrawing the same network doesn't redo it
+    network_path = os.path.splitext(args.out)[0] + '_network.tsv'
+    df.to_csv(network_path, sep='\t', index=False)
+    layout = render.cached_layout(network_path, seed=args.seed)
 
-    net.show("example.html")
+    render.render_html(df, layout, args.out)
 
 
 if __name__ == "__main__":
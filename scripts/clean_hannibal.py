@@ -1,47 +1,38 @@
 ## This is my procedure for cleaning the scrape from the 'Hannibal (TV)' tag
 
 import argparse
-import json
-import numpy as np
-from hannstats import utils
+import sys
+from hannstats import ao3
 
 def main():
     p = argparse.ArgumentParser()
 
-    p.add_argument("data", help="path to the Hannibal data (json format)")
+    p.add_argument("data", help="path to the Hannibal data (json or jsonl format)")
+    p.add_argument("-w", "--workers", type=int, default=None,
+                   help="Number of processes to clean chapter text across (default: one per core)")
 
     args = p.parse_args()
 
-    with open(args.data) as fp:
-        data = json.load(fp)
-
     # REDUCE SET SIZE
     ## limit for only fics where Hannibal is the primary fandom
-    data = [story for story in data if story['fandoms'][0] == 'Hannibal (TV)']
 
     ## Remove of fan-art and podcasts (something totally worth looking at
     ## in a follow-up project!)
     unwanted_tags = ['Fanart', 'Podfic']
 
-    data = [story for story in data if all(tag not in story['additional_tags'] for tag in unwanted_tags)]
-
     ## Finally, limit length to between the 5th and 95th quantile to remove outliers
-    word_counts = np.array([story['words'] for story in data])
-    q_05 = np.quantile(word_counts, 0.05)
-    q_95 = np.quantile(word_counts, 0.95)
-
-    data = [story for story in data if q_05 < story['words'] and story['words'] < q_95]
 
     # CLEAN TEXT
-    for story in data:
-        for chapter in story['chapters']:
-            chapter['text'] = utils.clean_AO3_text(chapter['text'])
+    ## The fics are streamed through these steps one at a time rather than loaded all at once
+    data = ao3.clean_scrape(args.data, 'Hannibal (TV)', unwanted_tags, lower=0.05, upper=0.95,
+                            workers=args.workers)
 
     # PRINT
 
-    print(json.dumps(data))
+    ao3.write_json_array(data, sys.stdout)
+    print()
 
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
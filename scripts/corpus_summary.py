@@ -12,6 +12,7 @@ from nltk.tokenize import RegexpTokenizer, sent_tokenize
 from nltk.stem.wordnet import WordNetLemmatizer
 from collections import Counter
 from nltk.util import ngrams
+from hannstats import utils, corpus
 nltk.download('stopwords')
 nltk.download('punkt')
 nltk.download('wordnet')
@@ -21,16 +22,19 @@ def main():
     
     parser = argparse.ArgumentParser()
     parser.add_argument("corpus_path", 
-                        help="directory with text files that make up the corpus"
+                        help="directory with text files that make up the corpus, or a packed corpus"
                         )
     args = parser.parse_args()
 
-    texts = []
-    for doc in os.listdir(args.corpus_path):
-        if doc[-4:] == '.txt':
-            path = os.path.join(args.corpus_path, doc)
-            with open(path) as fp:
-                texts.append(fp.read().decode('utf-8'))
+    if corpus.is_pack(args.corpus_path):
+        texts = utils.load_texts(args.corpus_path)
+    else:
+        texts = []
+        for doc in os.listdir(args.corpus_path):
+            if doc[-4:] == '.txt':
+                path = os.path.join(args.corpus_path, doc)
+                with open(path) as fp:
+                    texts.append(fp.read().decode('utf-8'))
 
     # Average sentnece length
     sents = [sent for sentlist in [sent_tokenize(text) for text in texts] for sent in sentlist]
@@ -7,14 +7,14 @@
 # - Topic modelling of the dialog
 
 import argparse
-from hannstats import utils,visuals
+from hannstats import utils,visuals,sentiment,tables
+from hannstats.store import CorpusStore
 import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
 import os
 import pandas as pd
 import json
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
 font_sizes = {
     "fig": 20.0,
@@ -27,6 +27,10 @@ def main():
     parser.add_argument("-n", "--novels", help="Folder with dialog tables for novels", required=True)
     parser.add_argument("-s", "--screenplays", help="Folder with dialog tables for screenplays", required=True)
     parser.add_argument("-f", "--fanfic", help="Folder with dialog tables for fanfic", required=True)
+    parser.add_argument("--sentiment-cache", default=sentiment.DEFAULT_SENTIMENT_CACHE,
+                        help="sqlite file to keep sentiment scores in, so lines are only scored once across runs")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of processes to score sentiment across (default: one per core)")
 
     args = parser.parse_args()
 
@@ -35,29 +39,17 @@ def main():
     s_paths = [os.path.join(args.screenplays, fname) for fname in os.listdir(args.screenplays)]
     f_paths = [os.path.join(args.fanfic, fname) for fname in os.listdir(args.fanfic)]
 
-    # Load all the data into pandas dataframes
-    n_frames = [pd.read_csv(np, sep='\t') for np in n_paths]
-    f_frames = [pd.read_csv(fp, sep='\t') for fp in f_paths]
-    s_frames = [pd.read_csv(sp, sep='\t') for sp in s_paths]
-    for i in range(len(n_frames)):
-        df = n_frames[i]
-        df['frame_number'] = i
-    for i in range(len(f_frames)):
-        df = f_frames[i]
-        df['frame_number'] = i
-    for i in range(len(s_frames)):
-        df = s_frames[i]
-        df['frame_number'] = i
-
-    # Also make corpora-level frames for each
-    n_corp = pd.concat(n_frames)
-    f_corp = pd.concat(f_frames)
-    s_corp = pd.concat(s_frames)
+    # Load all the data into one store indexed by corpus, speaker and item
+    # (.tsv or .dtab, only the columns used below; each table's position is its item_num)
+    n_frames = [tables.read_table(np, columns=['speaker']) for np in n_paths]
+    f_frames = [tables.read_table(fp, columns=['speaker']) for fp in f_paths]
+    s_frames = [tables.read_table(sp, columns=['speaker', 'dialog']) for sp in s_paths]
+    store = CorpusStore.from_frames({'novels': n_frames, 'screenplays': s_frames, 'fanfic': f_frames})
 
     # PLOT 1: Dialog distribution over characters
-    novel_chars = n_corp['speaker'].value_counts(normalize=True).iloc[:10]*100
-    screenplay_chars = s_corp['speaker'].value_counts(normalize=True).iloc[:10]*100
-    fic_chars = f_corp['speaker'].value_counts(normalize=True).iloc[:10]*100
+    novel_chars = store.speaker_counts('novels', normalize=True).iloc[:10]*100
+    screenplay_chars = store.speaker_counts('screenplays', normalize=True).iloc[:10]*100
+    fic_chars = store.speaker_counts('fanfic', normalize=True).iloc[:10]*100
     fig = plt.figure(figsize=(12, 5))
     gs = GridSpec(nrows=1, ncols=3)
     ax0 = fig.add_subplot(gs[0, 0])
@@ -80,37 +72,31 @@ def main():
     # PLOT 2: Dialog Sentiment
     # We'll just track the three main charactesrs from the show
     characters = ['Hannibal', 'Will Graham', 'Jack Crawford']
-    vsent = SentimentIntensityAnalyzer()
     cpal = visuals.get_color_palette()
-    for frame in s_frames:
-        frame['sentiment'] = frame['dialog'].map(lambda x: vsent.polarity_scores(x)['compound'])
+    # Score every screenplay line once (lines seen in an earlier run come from the cache; novels and
+    # fan fiction were read without dialog, so they get NaN)
+    sentiment.add_sentiment(store.frame, cache_path=args.sentiment_cache, workers=args.workers)
 
     ## First episodes vs last episodes
-    s1e1 = s_frames[0].copy()
-    s2e1 = s_frames[13].copy()
-    s3e1 = s_frames[26].copy()
-    s1e13 = s_frames[12].copy()
-    s2e13 = s_frames[25].copy()
-    s3e13 = s_frames[-1].copy()
+    episodes = [0, 13, 26, 12, 25, len(s_frames) - 1]
 
     episode_names = ['S1E1: Aperitif', 'S2E1: Kaiseki', 'S3E1: Antipasto', 'S1E13: Savoureux', 'S2E13: Mizumono', 'S3E13: The Wrath of the Lamb']
-    frames = [s1e1, s2e1, s3e1, s1e13, s2e13, s3e13]
 
     fig = plt.figure(figsize=(16,9))
     gs = GridSpec(nrows=2, ncols=3)
-    for i in range(len(frames)):
+    for i in range(len(episodes)):
         ax = fig.add_subplot(gs[i//3, i%3])
-        df = frames[i]
+        episode = episodes[i]
         for j in range(len(characters)):
             char = characters[j]
             col = cpal[j]
-            char_uts = df.loc[df['speaker'] == char].copy()
+            char_uts = store.select('screenplays', char, episode).copy()
 
             # xvals are the dialog's % of the way through the episode (10 bins)
-            char_uts['ep_pct'] = (char_uts.index / df.shape[0]) // 0.1 / 0.1
+            char_uts['ep_pct'] = (char_uts['line'] / store.item_size('screenplays', episode)) // 0.1 / 0.1
 
             # Get average sent per bin
-            char_uts = char_uts.groupby('ep_pct').mean()
+            char_uts = char_uts.groupby('ep_pct')[['sentiment']].mean()
 
             visuals.line(char_uts.index, char_uts['sentiment'], ax=ax, color=col, label=char)
 
@@ -126,19 +112,15 @@ def main():
     plt.clf()
 
     ## Whole show
-    fig = plt.figure(figsize=(16,9))
-    s_corp_mains = s_corp.loc[s_corp['speaker'].isin(characters)].copy()
-    s_corp_mains['sentiment'] = s_corp_mains['dialog'].map(lambda x: vsent.polarity_scores(x)['compound'])
-
     fig = plt.figure(figsize=(12,5))
     ax = plt.gca()
     for i in range(len(characters)):
         char = characters[i]
         col = cpal[i]
-        char_uts = s_corp_mains.loc[s_corp_mains['speaker'] == char].copy()
+        char_uts = store.select('screenplays', char)
 
         # Get average sent per episode
-        char_uts = char_uts.groupby('frame_number').mean()
+        char_uts = char_uts.groupby('item_num')[['sentiment']].mean()
 
         visuals.line(char_uts.index, char_uts['sentiment'], ax=ax, color=col, label=char)
 
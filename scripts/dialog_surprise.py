@@ -4,6 +4,7 @@ import argparse
 import pandas as pd
 from scipy.stats import entropy
 from hannstats import visuals
+from hannstats.store import CorpusStore
 import matplotlib.pyplot as plt
 
 font_sizes = {
@@ -21,7 +22,8 @@ def represents_int(s):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("topics_file", help="A .tsv with a speaker column, a corpus_name topic, and a column for each topic numbered 0 to n-1")
+    parser.add_argument("topics_file", help="A .tsv with a speaker column, a corpus_name column, and a column for each topic numbered 0 to n-1 \
+                              (an item_num column is optional)")
 
     args = parser.parse_args()
 
@@ -30,26 +32,24 @@ def main():
     topics = [column for column in df.columns if represents_int(column)]
     characters = df['speaker'].unique()
 
-    # Get a separate frame for each corpus, and the corpus names while we're at it
-    frames = []
+    # Index the rows by corpus and speaker, so each character's rows in a corpus are a slice
+    store = CorpusStore(df.rename(columns={'corpus_name': 'corpus'}))
     corpora = ['novels', 'screenplays', 'fanfic']
-    for corpus in corpora:
-        frames.append(df.loc[df['corpus_name'] == corpus].copy())
 
     for char in characters:
         print(f"Top topics for {char}:")
-        for i in range(len(frames)):
+        for i in range(len(corpora)):
             corp = corpora[i]
-            char_corp = frames[i][frames[i]['speaker'] == char]
+            char_corp = store.select(corp, char)
             if char_corp.shape[0] > 0:
                 top_topic = char_corp["Dominant Topic"].mode().iloc[0]
                 print(f"\t{corp}: {top_topic}")
 
     for char in characters:
         print(f"{char}:")
-        for i in range(len(frames)-1):
-            a = frames[i].loc[frames[i]['speaker'] == char][topics].copy()
-            b = frames[i+1].loc[frames[i+1]['speaker'] == char][topics].copy()
+        for i in range(len(corpora)-1):
+            a = store.select(corpora[i], char)[topics]
+            b = store.select(corpora[i+1], char)[topics]
             a_vec = a.sum() / a.shape[0]
             b_vec = b.sum() / b.shape[0]
             ent = entropy(a_vec, b_vec)
@@ -59,9 +59,9 @@ def main():
     entropy_data = {"character": [], "novel-screenplay entropy": [], "screenplay-fanfic entropy": [], "novel-fanfic entropy": []}
     for char in characters:
         entropy_data["character"].append(char)
-        novels = frames[0].loc[frames[0]['speaker'] == char][topics].copy()
-        screenplays = frames[1].loc[frames[1]['speaker'] == char][topics].copy()
-        fanfic = frames[2].loc[frames[2]['speaker'] == char][topics].copy()
+        novels = store.select('novels', char)[topics]
+        screenplays = store.select('screenplays', char)[topics]
+        fanfic = store.select('fanfic', char)[topics]
         n_vec = novels.sum() / novels.shape[0]
         s_vec = screenplays.sum() / screenplays.shape[0]
         f_vec = fanfic.sum() / fanfic.shape[0]
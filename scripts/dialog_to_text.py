@@ -4,6 +4,8 @@ import argparse
 import os
 import pandas as pd
 import json
+from hannstats.store import CorpusStore
+from hannstats import tables
 
 def main():
     parser = argparse.ArgumentParser()
@@ -15,8 +17,8 @@ def main():
 
     args = parser.parse_args()
 
-    paths = list(reversed([os.path.join(args.dialog_tables, fname) for fname in os.listdir(args.dialog_tables) if fname[-4:] == '.tsv']))
-    frames = [pd.read_csv(np, sep='\t') for np in paths]
+    paths = list(reversed([os.path.join(args.dialog_tables, fname) for fname in os.listdir(args.dialog_tables) if fname.endswith(('.tsv', tables.DTAB_EXTENSION))]))
+    frames = [tables.read_table(np, columns=['speaker', 'dialog']) for np in paths]
 
     print(paths[0])
 
@@ -24,14 +26,16 @@ def main():
     with open(args.character_list) as fp:
         characters = json.load(fp)
 
+    # Index the dialog by table and speaker, so each character's lines in a table are a slice
+    store = CorpusStore.from_frames({"dialog": frames})
+
     data = {"speaker": [],
             "item_num": [], # What frame was it from?
             "path": []}
 
     for i in range(len(frames)):
         for char in characters:
-            frame = frames[i]
-            cf = frame.loc[frame['speaker'] == char]
+            cf = store.select("dialog", char, i)
             # Skip characters who don't speak at all
             if cf.shape[0] > 0:
                 fname = f"{i}_{char}.txt"
@@ -1,6 +1,6 @@
 # Make a network file for each screenplay
 
-from hannstats import utils
+from hannstats import utils, characters
 from argparse import ArgumentParser
 import pandas as pd
 import os
@@ -15,6 +15,9 @@ def main():
 
     parser.add_argument("fandom_file", help=".json file from a fandom")
     parser.add_argument("outpath", help="Where to output")
+    parser.add_argument("--fuzzy", type=float, default=None,
+                        help="Also bin character tags that are close to a known alias (similarity threshold, e.g. 0.75)")
+    parser.add_argument("--report", help="With --fuzzy, where to write the table of tags that were binned that way")
 
     args = parser.parse_args()
 
@@ -22,9 +25,13 @@ def main():
     with open(args.fandom_file) as fp:
         data = json.load(fp)
 
-    fandom_net = utils.fandom_network(data, _CHAR_BINS)
+    resolver = characters.get_resolver(_CHAR_BINS, fuzzy=args.fuzzy)
+    fandom_net = utils.fandom_network(data, resolver)
 
     fandom_net.to_csv(args.outpath, sep='\t', index=False)
 
+    if args.report:
+        resolver.report().to_csv(args.report, sep='\t', index=False)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,27 +1,35 @@
 import argparse
-import json
 import os
+from hannstats import ao3, corpus
+
+def _full_texts(data):
+	for story in data:
+		yield story['id'], '\n'.join([chap['text'] for chap in story['chapters']])
 
 def main():
 	parser = argparse.ArgumentParser()
 
-	parser.add_argument("data", help="Path to the .json file with the fandom data")
+	parser.add_argument("data", help="Path to the .json (or .jsonl) file with the fandom data")
 	parser.add_argument("outdir", help="Path to the output directory")
+	parser.add_argument("--pack", action='store_true',
+						help="Write one packed corpus to outdir instead of a .txt per story. \
+							  Stories can then be read as <outdir>/<id> with utils.load_texts")
 
 	args = parser.parse_args()
 
-	with open(args.data) as fp:
-		data = json.load(fp)
+	data = ao3.iter_fics(args.data)
 
-	for story in data:
-		fname = story['id'] + '.txt'
-		outpath = os.path.join(args.outdir, fname)
+	if args.pack:
+		corpus.write_pack(_full_texts(data), args.outdir)
+		return
 
-		full_text = '\n'.join([chap['text'] for chap in story['chapters']])
+	for story_id, full_text in _full_texts(data):
+		fname = story_id + '.txt'
+		outpath = os.path.join(args.outdir, fname)
 
 		with open(outpath, 'w') as fp:
 			fp.write(full_text)
 
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
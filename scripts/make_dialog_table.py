@@ -1,9 +1,9 @@
 # Given a directory of .book files or screenplay .txts, produce a cleaned dialog table
 import pandas as pd
-from hannstats import utils
+from hannstats import utils, batch, cache
 from argparse import ArgumentParser
+from functools import partial
 import os
-import json
 
 _SCRIPT_DIR = os.path.dirname(__file__)
 _CHAR_BINS = os.path.join(_SCRIPT_DIR, "..", "character_bins.json")
@@ -16,39 +16,36 @@ def main():
     parser.add_argument("--type", 
                         help="Is it a .book file or a screenplay? Options: ['book', 'screenplay']", 
                         required=True)
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes (default: one per core)")
+    parser.add_argument("--cache", help="Directory to cache parsed results in, so unchanged inputs are not parsed again")
+    parser.add_argument("--format", choices=['tsv', 'dtab'], default='tsv',
+                        help="Write tab-separated tables, or compact columnar .dtab tables (see hannstats.tables)")
 
     args = parser.parse_args()
     files = os.listdir(args.datapath)
 
     if args.type == 'book':
-        paths = [os.path.join(args.datapath, fname) for fname in files if fname[-5:] == '.book']
-        frames = [utils.load_bnlp_dialog(np) for np in paths]
+        files = [fname for fname in files if fname[-5:] == '.book']
+        parse = utils.load_bnlp_dialog
     elif args.type == 'screenplay':
-        paths = [os.path.join(args.datapath, fname) for fname in files if fname[-4:] == '.txt']
-        texts = []
-        for p in paths:
-            with open(p) as fp:
-                texts.append(fp.read())
-        frames = [utils.screenplay_to_dialog_table(t) for t in texts]
-        
+        files = [fname for fname in files if fname[-4:] == '.txt']
+        parse = utils.screenplay_to_dialog_table
     else:
         print("That is not a valid type")
         exit(0)
 
-    with open(_CHAR_BINS) as fp:
-        char_bins = utils.flip_mapping(json.load(fp))
+    if args.cache:
+        parse = cache.cached(parse, args.cache)
 
-    for frame in frames:
-        frame["speaker"] = frame["speaker"].str.lower()
-        frame["speaker"] = frame["speaker"].map(lambda x: char_bins[x] if x in char_bins else x)
-        #frame["dialog"] = frame["dialog"].map(lambda x: x.strip('"'))
-        #frame["processed_dialog"] = frame["dialog"].str.lower()
+    paths = [os.path.join(args.datapath, fname) for fname in files]
+    outpaths = [os.path.join(args.outdir, fname.split('.')[0] + '_dialog.' + args.format) for fname in files]
 
-    for file, frame in zip(files, frames):
-        fname = file.split('.')[0] + '_dialog.tsv'
-        outpath = os.path.join(args.outdir, fname)
-        frame.to_csv(outpath, index=False, sep='\t')
+    batch.ingest(parse, paths, outpaths,
+                 workers=args.workers,
+                 text_input=(args.type == 'screenplay'),
+                 transform=partial(utils.bin_dialog_speakers, character_bins=_CHAR_BINS))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,10 @@
 # Mkae a network file for each novel
 
-from hannstats import utils
+from hannstats import utils, batch, cache
 from argparse import ArgumentParser
 import pandas as pd
 import os
+from functools import partial
 import json
 
 _SCRIPT_DIR = os.path.dirname(__file__)
@@ -13,22 +14,43 @@ _CHAR_BINS = os.path.join(_SCRIPT_DIR, "..", "character_bins.json")
 def main():
     parser = ArgumentParser()
 
-    parser.add_argument("tokensdir", help="Directory where the .tokens files are stored")
+    parser.add_argument("tokensdir", help="Directory where the .tokens files (or token stores from tokens_to_store.py) are stored")
     parser.add_argument("bookdir", help="Directory where the .book files are stored")
     parser.add_argument("outdir", help="Where to output")
-    parser.add_argument("--dist", required=False, nargs='?', default=15, const=15, type=int,
-                        help="How big should the sliding window be for determining connection")
+    parser.add_argument("--dist", required=False, nargs='+', default=[15], type=int,
+                        help="How big should the sliding window be for determining connection. \
+                              Several sizes give one network file per novel with a dist column")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes (default: one per core)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Number of processes to split each novel's token stream across (single --dist only). \
+                              Each worker starts its own shards, so the number of workers is capped at \
+                              the number of cores divided by --shards")
+    parser.add_argument("--cache", help="Directory to cache parsed results in, so unchanged inputs are not parsed again")
 
     args = parser.parse_args()
 
     token_files = [os.path.join(args.tokensdir, file) for file in os.listdir(args.tokensdir)]
     book_files = [os.path.join(args.bookdir, file) for file in os.listdir(args.bookdir)]
     novel_names = [fname.split('.')[0] for fname in os.listdir(args.tokensdir)]
-    novel_nets = [utils.tokens_to_network(t,b,_CHAR_BINS,args.dist) for t,b, in zip(token_files, book_files)]
+    outpaths = [os.path.join(args.outdir, name + '_network.tsv') for name in novel_names]
+
+    dist = args.dist[0] if len(args.dist) == 1 else args.dist
+
+    parse = utils.tokens_to_network
+    if args.cache:
+        parse = cache.cached(parse, args.cache)
+    workers = args.workers
+    if args.shards > 1:
+        parse = partial(parse, workers=args.shards)
+        # Every worker runs a pool of its own, so keep workers * shards within the cores
+        workers = max(1, min(workers or os.cpu_count(), os.cpu_count() // args.shards))
 
     # Output the files:
-    for net, name in zip(novel_nets, novel_names):
-        net.to_csv(os.path.join(args.outdir, name + '_network.tsv'), sep='\t', index=False)
+    batch.ingest(parse, list(zip(token_files, book_files)), outpaths,
+                 workers=workers,
+                 character_bins=_CHAR_BINS,
+                 dist=dist)
 
 
 
@@ -1,24 +1,30 @@
 import argparse
-import random
-import json
+import sys
+from hannstats import ao3
 def main():
 	p = argparse.ArgumentParser()
 
-	p.add_argument('data', help='path to a json file')
+	p.add_argument('data', help='path to a json or jsonl file')
 	p.add_argument("-n", "--num", type=int, help="Size of the sample", required=True)
+	p.add_argument("-s", "--seed", type=int, default=None, help="Random seed, for a reproducible sample")
+	p.add_argument("--stratify", default=None,
+				   help="Field to stratify the sample on, e.g. 'rating', or 'fandom' for the primary fandom")
 
 	args = p.parse_args()
 
-	with open(args.data) as fp:
-		data = json.load(fp)
+	# The scrape is read one fic at a time, only the sample is kept in memory. A stratified sample
+	# reads it twice: once for just the stratum field, to count the strata, then for the sample.
+	if args.stratify:
+		strata = ao3.iter_fics(args.data, fields=ao3.stratum_fields(args.stratify))
+		sample = ao3.stratified_sample(lambda: ao3.iter_fics(args.data), args.num, args.stratify,
+									   seed=args.seed, strata=strata)
+	else:
+		sample = ao3.reservoir_sample(ao3.iter_fics(args.data), args.num, seed=args.seed)
 
-	sample = random.sample(data, args.num)
-
-	jstring = json.dumps(sample)
-
-	print(jstring)
+	ao3.write_json_array(sample, sys.stdout)
+	print()
 
 
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
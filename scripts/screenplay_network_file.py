@@ -1,6 +1,6 @@
 # Make a network file for each screenplay
 
-from hannstats import utils
+from hannstats import utils, batch, cache
 from argparse import ArgumentParser
 import pandas as pd
 import os
@@ -15,18 +15,25 @@ def main():
 
     parser.add_argument("scriptsdir", help="Directory where the screenply .txt files are stored")
     parser.add_argument("outdir", help="Where to output")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes (default: one per core)")
+    parser.add_argument("--cache", help="Directory to cache parsed results in, so unchanged inputs are not parsed again")
 
     args = parser.parse_args()
 
     sp_files = [os.path.join(args.scriptsdir, file) for file in os.listdir(args.scriptsdir)]
-    sp_texts = utils.load_texts(sp_files)
     episode_names = [fname.split('.')[0] for fname in os.listdir(args.scriptsdir)]
-    sp_nets = [utils.script_to_network(s, _CHAR_BINS) for s in sp_texts]
+    outpaths = [os.path.join(args.outdir, name + '_network.tsv') for name in episode_names]
 
+    parse = utils.script_to_network
+    if args.cache:
+        parse = cache.cached(parse, args.cache)
 
     # Output the files:
-    for net, name in zip(sp_nets, episode_names):
-        net.to_csv(os.path.join(args.outdir, name + '_network.tsv'), sep='\t', index=False)
+    batch.ingest(parse, sp_files, outpaths,
+                 workers=args.workers,
+                 text_input=True,
+                 character_bins=_CHAR_BINS)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,34 @@
+# Make a temporal network from a season of screenplays: what each episode adds to the network,
+# and the network as of each episode
+
+from hannstats import utils
+from argparse import ArgumentParser
+import os
+
+_SCRIPT_DIR = os.path.dirname(__file__)
+_CHAR_BINS = os.path.join(_SCRIPT_DIR, "..", "character_bins.json")
+
+
+def main():
+    parser = ArgumentParser()
+
+    parser.add_argument("scriptsdir", help="Directory where the screenplay .txt files are stored, named in episode order")
+    parser.add_argument("outpath", help="Where to write the per-episode edges (.tsv, with a running total per edge)")
+    parser.add_argument("--snapshots", help="Directory to also write the network as of each episode to")
+
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.scriptsdir) if f[-4:] == '.txt')
+    scripts = utils.load_texts([os.path.join(args.scriptsdir, f) for f in files])
+    episode_names = [fname.split('.')[0] for fname in files]
+
+    temporal = utils.scripts_to_temporal_network(scripts, _CHAR_BINS, labels=episode_names)
+    temporal.to_frame().to_csv(args.outpath, sep='\t', index=False)
+
+    if args.snapshots:
+        os.makedirs(args.snapshots, exist_ok=True)
+        for name, snapshot in temporal.snapshots():
+            snapshot.to_csv(os.path.join(args.snapshots, name + '_cumulative_network.tsv'), sep='\t', index=False)
+
+if __name__ == "__main__":
+    main()
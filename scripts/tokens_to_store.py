@@ -0,0 +1,30 @@
+# Convert each novel's booknlp .tokens file into a memory-mapped token store, so that
+# network and stats runs don't have to parse the .tokens files again
+
+from hannstats import booknlp
+from argparse import ArgumentParser
+import os
+
+
+def main():
+    parser = ArgumentParser()
+
+    parser.add_argument("tokensdir", help="Directory where the .tokens files are stored")
+    parser.add_argument("bookdir", help="Directory where the .book files are stored")
+    parser.add_argument("outdir", help="Where to put the token stores (one <novel>.tstore directory per novel)")
+
+    args = parser.parse_args()
+
+    book_files = {fname.split('.')[0]: os.path.join(args.bookdir, fname) for fname in os.listdir(args.bookdir)}
+
+    for fname in sorted(os.listdir(args.tokensdir)):
+        name = fname.split('.')[0]
+        if name not in book_files:
+            print(f"No .book file for {fname}, skipping")
+            continue
+        booknlp.convert_tokens(os.path.join(args.tokensdir, fname), book_files[name],
+                               os.path.join(args.outdir, name + '.tstore'))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,9 @@ import numpy as np
 import pandas as pd
 from pprint import pprint
 import os.path as osp
+import json
+import hashlib
+import inspect
 import pickle
 
 # Gensim
@@ -17,9 +20,9 @@ from gensim.utils import simple_preprocess
 from gensim.models import CoherenceModel
 from gensim.models.ldamodel import LdaModel
 
-# spacy for lemmatization
+# spacy for lemmatization (tagging only: the parser and NER are not needed for lemmas)
 import spacy
-nlp = spacy.load("en_core_web_sm")
+nlp = spacy.load("en_core_web_sm", disable=["parser", "ner"])
 
 # Plotting tools
 import pyLDAvis
@@ -43,7 +46,16 @@ stop_words.extend(['time', 'make', 'find', 'thing', 'know', 'see', 'want', 'thin
 stop_words = set(stop_words)
 from nltk.tokenize import word_tokenize
 
-from hannstats import utils
+from hannstats import utils, cache
+from hannstats.corpus import is_pack, index_files, texts_stamp
+
+# Preprocessing settings; together with the inputs they key the preprocessing cache
+_PHRASE_MIN_COUNT = 5
+_PHRASE_THRESHOLD = 100 # higher threshold fewer phrases.
+_ALLOWED_POSTAGS = ['NOUN', 'ADJ', 'VERB', 'ADV']
+# Filter out words that occur in less than 10 documents, or more than 50% of documents.
+_NO_BELOW = 10
+_NO_ABOVE = 0.5
 
 def _convertldaMalletToldaGen(mallet_model):
     model_gensim = LdaModel(
@@ -69,19 +81,45 @@ def _data_loading(datapath):
 
     return df
 
-def _lemmatize(tokens, allowed_postags):
-    doc = nlp(" ".join(tokens))
-    return [token.lemma_ for token in doc if token.pos_ in allowed_postags]
+# (lemma, POS) pairs of every surface token seen so far, so each word type only goes through spacy once
+_LEMMA_CACHE = {}
+
+def _lemmatize(docs, allowed_postags, batch_size=1000, n_process=1, contextual=False):
+    '''
+    Lemmatize tokenized documents, keeping the lemmas whose POS is in allowed_postags.
+
+    By default every distinct token is tagged once on its own and the result is memoized in
+    _LEMMA_CACHE, so repeated vocabulary never goes through the model again. Tags then don't depend
+    on the surrounding words; contextual=True tags each whole document instead (slower, no cache).
+
+    docs: list of lists of tokens
+    allowed_postags: POS tags to keep
+    batch_size: number of texts sent through nlp.pipe at a time
+    n_process: number of processes nlp.pipe uses
+    contextual: tag tokens in the context of their document
+    '''
+
+    if contextual:
+        texts = (" ".join(tokens) for tokens in docs)
+        return [[token.lemma_ for token in doc if token.pos_ in allowed_postags]
+                for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
 
-def _preprocess(df):
+    new = list(dict.fromkeys(tok for tokens in docs for tok in tokens if tok not in _LEMMA_CACHE))
+    for tok, doc in zip(new, nlp.pipe(new, batch_size=batch_size, n_process=n_process)):
+        _LEMMA_CACHE[tok] = [(token.lemma_, token.pos_) for token in doc]
+
+    return [[lemma for tok in tokens for lemma, pos in _LEMMA_CACHE[tok] if pos in allowed_postags]
+            for tokens in docs]
+
+def _preprocess(df, batch_size=1000, n_process=1, contextual=False):
     data = df.copy()
 
     # Tokenize
     data['tokens'] = data['text'].map(lambda x: simple_preprocess(x, deacc=True))
 
     # Build the bigram models
-    bigram = gensim.models.Phrases(data['tokens'], min_count=5, threshold=100) # higher threshold fewer phrases. 
-    trigram = gensim.models.Phrases(bigram[data['tokens']], threshold=100)
+    bigram = gensim.models.Phrases(data['tokens'], min_count=_PHRASE_MIN_COUNT, threshold=_PHRASE_THRESHOLD)
+    trigram = gensim.models.Phrases(bigram[data['tokens']], threshold=_PHRASE_THRESHOLD)
     # Faster way to get a sentence clubbed as a bigram
     bigram_mod = gensim.models.phrases.Phraser(bigram)
     trigram_mod = gensim.models.phrases.Phraser(trigram)
@@ -90,16 +128,102 @@ def _preprocess(df):
     data['tokens'] = data['tokens'].map(lambda x: bigram_mod[x])
     data['tokens'] = data['tokens'].map(lambda x: trigram_mod[bigram_mod[x]])
 
-     # Lemmatize
-    data['tokens'] = data['tokens'].map(lambda x: _lemmatize(x, allowed_postags=['NOUN', 'ADJ', 'VERB', 'ADV']))
+    # Lemmatize
+    data['tokens'] = _lemmatize(list(data['tokens']), allowed_postags=_ALLOWED_POSTAGS,
+                                batch_size=batch_size, n_process=n_process, contextual=contextual)
 
     # Stopword removal
     data['tokens'] = data['tokens'].map(lambda x: [tok for tok in x if tok not in stop_words])
 
-    return data
-
+    return data, bigram_mod, trigram_mod
+
+def _bag_of_words(tokens):
+    # Dictionary of the tokens (without too rare or too common words) and the bag-of-words corpus
+    id2word = corpora.Dictionary(tokens)
+    id2word.filter_extremes(no_below=_NO_BELOW, no_above=_NO_ABOVE)
+    bow = [id2word.doc2bow(text) for text in tokens]
+    return id2word, bow
+
+def _text_sources(paths):
+    # What the texts of a dataset come from, for the cache key: each text file (hashed by content), and
+    # for texts in a pack, the ids used, the pack's index files and the size and modification time of
+    # its texts rather than the whole pack
+    files = []
+    packs = {}
+    for path in paths:
+        pack_path, text_id = osp.split(path)
+        if pack_path in packs or (not osp.isfile(path) and is_pack(pack_path)):
+            packs.setdefault(pack_path, set()).add(text_id)
+        else:
+            files.append(path)
+    sources = list(dict.fromkeys(files))
+    for pack_path, ids in packs.items():
+        sources.append(index_files(pack_path) + ["texts:" + texts_stamp(pack_path), "ids:" + json.dumps(sorted(ids))])
+    return sources
+
+# Bump when preprocessing changes in a way the source hash below can't see (e.g. in a library)
+_PREPROCESSING_VERSION = 1
+
+def _preprocessing_code():
+    # Hash of the functions that turn texts into the cached artifacts, so editing any of them means
+    # preprocessing again, while editing the modelling code doesn't
+    h = hashlib.blake2b(digest_size=20)
+    for func in [_data_loading, _lemmatize, _preprocess, _bag_of_words, _write_artifacts]:
+        h.update(inspect.getsource(func).encode('utf-8'))
+    return h.hexdigest()
+
+def _write_artifacts(path, data, bigram_mod, trigram_mod, id2word, bow):
+    with open(osp.join(path, 'tokens.json'), 'w') as fp:
+        json.dump(list(data['tokens']), fp)
+    bigram_mod.save(osp.join(path, 'bigram.phr'))
+    trigram_mod.save(osp.join(path, 'trigram.phr'))
+    id2word.save(osp.join(path, 'dictionary.dict'))
+    corpora.MmCorpus.serialize(osp.join(path, 'corpus.mm'), bow)
+
+def _preprocessed(datapath, cache_dir=None, batch_size=1000, n_process=1, contextual=False):
+    '''
+    Load and preprocess a dataset, returning it with a tokens column along with the Dictionary and
+    the bag-of-words corpus. With a cache_dir, the artifacts (tokens, phrase models, Dictionary and
+    corpus) are kept as an entry of a cache.DiskCache there, keyed by a hash of the dataset file, the
+    texts it points to, the preprocessing code and the preprocessing settings, and a rerun with the
+    same inputs, code and settings loads them instead of preprocessing again. Old entries are
+    evicted like any other cache entry.
+
+    datapath: path to the dataset .tsv
+    cache_dir: directory to keep preprocessing artifacts in, or None to not cache
+    batch_size, n_process, contextual: see _lemmatize
+    '''
+
+    if cache_dir is None:
+        df, _, _ = _preprocess(_data_loading(datapath), batch_size, n_process, contextual)
+        id2word, bow = _bag_of_words(df['tokens'])
+        return df, id2word, bow
 
-def _topic_model(df, n_topics, 
+    df = pd.read_csv(datapath, sep='\t')
+    settings = {"phrase_min_count": _PHRASE_MIN_COUNT, "phrase_threshold": _PHRASE_THRESHOLD,
+                "allowed_postags": _ALLOWED_POSTAGS, "contextual": contextual,
+                "stop_words": sorted(stop_words), "no_below": _NO_BELOW, "no_above": _NO_ABOVE,
+                "spacy_model": f"{nlp.meta['name']}-{nlp.meta['version']}", "gensim": gensim.__version__}
+    store = cache.DiskCache(cache_dir)
+    key = store.content_key(["topic_model_preprocessing", str(_PREPROCESSING_VERSION), _preprocessing_code()],
+                            datapath, _text_sources(df['path']), settings=settings)
+
+    artifact_dir = store.get_dir(key)
+    if artifact_dir is None:
+        data, bigram_mod, trigram_mod = _preprocess(_data_loading(datapath), batch_size, n_process, contextual)
+        id2word, bow = _bag_of_words(data['tokens'])
+        artifact_dir = store.put_dir(key, lambda path: _write_artifacts(path, data, bigram_mod, trigram_mod, id2word, bow))
+    else:
+        print(f"Using preprocessing cached in {artifact_dir}")
+
+    with open(osp.join(artifact_dir, 'tokens.json')) as fp:
+        df['tokens'] = json.load(fp)
+    id2word = corpora.Dictionary.load(osp.join(artifact_dir, 'dictionary.dict'))
+    bow = corpora.MmCorpus(osp.join(artifact_dir, 'corpus.mm'))
+    return df, id2word, bow
+
+
+def _topic_model(df, id2word, corpus, n_topics, 
                  outpath_data=None, 
                  outpath_viz=None, 
                  pickle_path=None, 
@@ -111,19 +235,6 @@ def _topic_model(df, n_topics,
 
     data = df.copy()
 
-    # Create Dictionary
-    id2word = corpora.Dictionary(data['tokens'])
-
-    # Filter out words that occur in less than 10 documents, or more than
-    # 50% of documents.
-    id2word.filter_extremes(no_below=10, no_above=0.5)
-
-    # Create Corpus
-    texts = data['tokens']
-
-    # Term Document Frequency
-    corpus = [id2word.doc2bow(text) for text in texts]
-
     if mallet_path:
         lda_model = gensim.models.wrappers.LdaMallet(mallet_path,
                                                      corpus=corpus, num_topics=n_topics, id2word=id2word,
@@ -151,7 +262,7 @@ def _topic_model(df, n_topics,
         ldagensim = _convertldaMalletToldaGen(lda_model)
         p = gensimvis.prepare(ldagensim, corpus, id2word, mds='mmds', sort_topics=False)
         
-        corpus_topic_df = data.drop(['text', 'tokens'], axis=1)
+        corpus_topic_df = data.drop(columns=['text', 'tokens'], errors='ignore')
         #all_topics_frame["Top Topic"] = all_topics_frame.idxmax(axis=1)
         corpus_topic_df['Dominant Topic'] = [item[0]+1 for item in corpus_topics]
         corpus_topic_df['Contribution %'] = [round(item[1]*100, 2) for item in corpus_topics]
@@ -194,7 +305,7 @@ def _topic_model(df, n_topics,
         all_topics_numpy = all_topics_csr.T.toarray()
         all_topics_frame = pd.DataFrame(all_topics_numpy)
         all_topics_frame["Dominant Topic"] = all_topics_frame.idxmax(axis=1)+1
-        corpus_topic_df = pd.concat([data.drop(['text', 'tokens'], axis=1), all_topics_frame], axis=1)
+        corpus_topic_df = pd.concat([data.drop(columns=['text', 'tokens'], errors='ignore'), all_topics_frame], axis=1)
 
         topic_cols = {t:t+1 for t in range(n_topics)}
         corpus_topic_df = corpus_topic_df.rename(columns=topic_cols)
@@ -253,16 +364,39 @@ def main():
                         help="num_iterations to pass to Mallet. Default 1000.", 
                         nargs='?', type=int, const=1000, default=1000)
 
-    args = parser.parse_args()
+    parser.add_argument("--batch_size",
+                        help="Number of texts spacy lemmatizes at a time. Default 1000.",
+                        type=int, default=1000)
+
+    parser.add_argument("--n_process",
+                        help="Number of processes spacy lemmatizes with. Default 1.",
+                        type=int, default=1)
 
-    print("Loading Data...")
-    df = _data_loading(args.datapath)
+    parser.add_argument("--contextual_lemmas",
+                        help="Tag each document as a whole instead of tagging every distinct \
+                              word once. Slower, but POS tags can use the surrounding words.",
+                        action='store_true')
+
+    parser.add_argument("--preprocess_cache",
+                        help="Directory to keep preprocessing results in, so reruns on the same \
+                              data with the same settings go straight to modelling.",
+                        default=osp.join(cache.DEFAULT_CACHE_DIR, "topic_models"))
+
+    parser.add_argument("--no_cache",
+                        help="Always preprocess from scratch and don't cache the results.",
+                        action='store_true')
+
+    args = parser.parse_args()
 
-    print("Preprocessing...")
-    df = _preprocess(df)
+    print("Loading and Preprocessing...")
+    df, id2word, corpus = _preprocessed(args.datapath,
+                                        cache_dir=None if args.no_cache else args.preprocess_cache,
+                                        batch_size=args.batch_size,
+                                        n_process=args.n_process,
+                                        contextual=args.contextual_lemmas)
 
     print("Modelling...")
-    _topic_model(df, args.n, args.outpath_data, args.outpath_viz, args.pickle_path, 
+    _topic_model(df, id2word, corpus, args.n, args.outpath_data, args.outpath_viz, args.pickle_path, 
                 mallet_path=args.mallet_path, 
                 alpha=args.alpha, 
                 optimize_interval=args.optimize_interval, 
@@ -0,0 +1,223 @@
+# Streaming readers and filters for AO3 scrapes, so that a whole scrape never has to be in memory at once
+
+import json
+import random
+import numpy as np
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from hannstats.jsonstream import JSONStream
+from hannstats.utils import clean_AO3_texts
+
+
+def _read_fields(stream, fields):
+    # Decode only some fields of the fic starting here, skipping the rest (chapters in particular)
+    fic = {}
+    for name in stream.keys():
+        if name in fields:
+            fic[name] = stream.value()
+        else:
+            stream.skip()
+    return fic
+
+def iter_fics(path, fields=None):
+    '''
+    Iterate over the fics of an AO3 scrape one at a time. The scrape can be JSONL (one fic per line)
+    or a single JSON array of fics.
+
+    path: path to the scrape
+    fields: if given, only these fields of each fic are kept. In a JSON array the other fields are
+            skipped without being decoded, which makes a pass over e.g. ratings cheap.
+    '''
+
+    with open(path) as fp:
+        stream = JSONStream(fp)
+        if stream.peek() == '[':
+            if fields is None:
+                yield from stream.items()
+            else:
+                for _ in stream.elements():
+                    yield _read_fields(stream, fields)
+            return
+
+        # JSONL: start again from the top, one record per line
+        fp.seek(0)
+        for line in fp:
+            if line.strip():
+                fic = json.loads(line)
+                yield fic if fields is None else {name: fic[name] for name in fields if name in fic}
+
+def primary_fandom(fic):
+    # A fic's first listed fandom, or None if it lists none
+    fandoms = fic.get('fandoms')
+    return fandoms[0] if fandoms else None
+
+def in_fandom(fics, fandom):
+    # Only fics whose primary (first listed) fandom is fandom
+    return (fic for fic in fics if primary_fandom(fic) == fandom)
+
+def without_tags(fics, tags):
+    # Drop fics carrying any of tags in their additional tags
+    return (fic for fic in fics if all(tag not in fic['additional_tags'] for tag in tags))
+
+def within_words(fics, low, high):
+    # Only fics with strictly between low and high words
+    return (fic for fic in fics if low < fic['words'] and fic['words'] < high)
+
+def _clean_batch(batch, pool):
+    texts = [chapter['text'] for fic in batch for chapter in fic['chapters']]
+    cleaned = iter(clean_AO3_texts(texts, workers=1, pool=pool))
+    for fic in batch:
+        for chapter in fic['chapters']:
+            chapter['text'] = next(cleaned)
+    return batch
+
+def clean_chapters(fics, workers=1, batch_size=256):
+    # Strip HTML from the text of every chapter. With more than one worker, batch_size fics at a time are
+    # cleaned across a process pool.
+    fics = iter(fics)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        while True:
+            batch = list(islice(fics, batch_size))
+            if not batch:
+                return
+            yield from _clean_batch(batch, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def word_quantiles(fics, quantiles):
+    # Quantiles of the word counts of fics. Only the counts are kept, not the fics.
+    counts = np.fromiter((fic['words'] for fic in fics), dtype=np.int64)
+    return [np.quantile(counts, q) for q in quantiles]
+
+# The fields in_fandom, without_tags and word_quantiles read
+_QUANTILE_FIELDS = ['fandoms', 'additional_tags', 'words']
+
+def clean_scrape(path, fandom, unwanted_tags, lower=0.05, upper=0.95, workers=1):
+    '''
+    Stream the cleaned fics of a scrape: fics with fandom as their primary fandom, none of
+    unwanted_tags, and a word count strictly between the lower and upper quantiles of those fics,
+    with the HTML stripped from their chapters. The scrape is read twice, once for the word count
+    quantiles and once for the fics themselves.
+
+    path: path to the scrape (JSONL or a JSON array)
+    fandom: primary fandom to keep
+    unwanted_tags: list of additional tags to drop fics for
+    lower, upper: quantiles of word count to cut at
+    workers: number of processes to clean chapters across; None uses every core
+    '''
+
+    def filtered(fields=None):
+        return without_tags(in_fandom(iter_fics(path, fields=fields), fandom), unwanted_tags)
+
+    # The quantile pass only needs the fields the filters read, so chapters are skipped undecoded
+    low, high = word_quantiles(filtered(fields=_QUANTILE_FIELDS), [lower, upper])
+    return clean_chapters(within_words(filtered(), low, high), workers=workers)
+
+def reservoir_sample(fics, n, seed=None):
+    '''
+    Uniform random sample of n fics (all of them if there are fewer), taken in one pass with reservoir
+    sampling so that only the sample is ever held in memory.
+
+    fics: iterable of fics, e.g. iter_fics(path)
+    n: size of the sample
+    seed: seed for the random number generator, for a reproducible sample
+    '''
+
+    rng = random.Random(seed)
+    reservoir = []
+    for i, fic in enumerate(fics):
+        if i < n:
+            reservoir.append(fic)
+        else:
+            j = rng.randrange(i + 1)
+            if j < n:
+                reservoir[j] = fic
+    rng.shuffle(reservoir)
+    return reservoir
+
+def _stratum(fic, key):
+    if callable(key):
+        value = key(fic)
+    elif key == 'fandom':
+        value = primary_fandom(fic)
+    else:
+        value = fic[key]
+    return tuple(value) if isinstance(value, list) else value
+
+def stratum_fields(key):
+    # The fic fields a stratification key reads (None for a function, which may read anything)
+    if callable(key):
+        return None
+    return ['fandoms'] if key == 'fandom' else [key]
+
+def stratified_sample(fics, n, key, seed=None, strata=None):
+    '''
+    Random sample of n fics with each stratum represented in proportion to its share of the fics
+    (largest remainder rounding). A first pass counts the strata to fix each one's quota, and a
+    second pass keeps a reservoir of its quota's size for each stratum, so only the sample is ever
+    held in memory.
+
+    fics: the fics, read twice: a list, or a function returning a new iterator over them each time
+          (e.g. lambda: iter_fics(path))
+    n: size of the sample
+    key: field to stratify on (e.g. 'rating'), 'fandom' for the primary fandom (None if a fic has no
+         fandoms), or a function of a fic
+    seed: seed for the random number generator, for a reproducible sample
+    strata: optional fics to count strata from in the first pass instead of fics; they only need
+            the key's field, e.g. iter_fics(path, fields=stratum_fields(key))
+    '''
+
+    if not callable(fics) and iter(fics) is fics:
+        raise ValueError("stratified_sample reads the fics twice; pass a list or a function returning an iterator")
+    read = fics if callable(fics) else (lambda: iter(fics))
+
+    # First pass: how many fics in each stratum
+    counts = {}
+    for fic in (strata if strata is not None else read()):
+        stratum = _stratum(fic, key)
+        counts[stratum] = counts.get(stratum, 0) + 1
+
+    total = sum(counts.values())
+    if total <= n:
+        quotas = counts
+    else:
+        # Largest remainder: everyone gets the floor of their share, the leftover goes to the largest fractions
+        shares = {stratum: n * count / total for stratum, count in counts.items()}
+        quotas = {stratum: int(share) for stratum, share in shares.items()}
+        leftover = n - sum(quotas.values())
+        for stratum in sorted(shares, key=lambda s: quotas[s] - shares[s])[:leftover]:
+            quotas[stratum] += 1
+
+    # Second pass: a reservoir of each stratum's quota
+    rng = random.Random(seed)
+    reservoirs = {stratum: [] for stratum in quotas}
+    seen = dict.fromkeys(quotas, 0)
+    for fic in read():
+        stratum = _stratum(fic, key)
+        quota = quotas.get(stratum, 0)
+        if quota == 0:
+            continue
+        reservoir = reservoirs[stratum]
+        if seen[stratum] < quota:
+            reservoir.append(fic)
+        else:
+            j = rng.randrange(seen[stratum] + 1)
+            if j < quota:
+                reservoir[j] = fic
+        seen[stratum] += 1
+
+    sample = [fic for reservoir in reservoirs.values() for fic in reservoir]
+    rng.shuffle(sample)
+    return sample
+
+def write_json_array(records, fp):
+    # Write records to fp as one JSON array, one record at a time. The output is the same as
+    # json.dump(list(records), fp).
+    fp.write('[')
+    for i, record in enumerate(records):
+        if i > 0:
+            fp.write(', ')
+        fp.write(json.dumps(record))
+    fp.write(']')
@@ -0,0 +1,55 @@
+# Run the hannstats parsers over many input files at once, one process per core
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from hannstats import tables
+
+
+def _read_text(path):
+    with open(path) as fp:
+        return fp.read()
+
+def _ingest_one(parse, inputs, outpath, text_input, transform, kwargs):
+    # Parse one input and write the result straight away, so that frames never
+    # pile up in the parent process
+    if isinstance(inputs, str):
+        inputs = (inputs,)
+    if text_input:
+        inputs = [_read_text(path) for path in inputs]
+
+    df = parse(*inputs, **kwargs)
+    if transform is not None:
+        df = transform(df)
+
+    tables.write_table(df, outpath)
+    return outpath
+
+def ingest(parse, inputs, outpaths, workers=None, text_input=False, transform=None, **kwargs):
+    '''
+    Run a parser over many inputs across a pool of worker processes, writing each resulting frame
+    to its output path as soon as it is done (as a .dtab if the path ends in .dtab, otherwise
+    as a .tsv; see tables.write_table). Returns the output paths in input order.
+
+    parse: function returning a pandas dataframe, e.g. utils.load_bnlp_dialog
+    inputs: list of input paths, or of tuples of paths for parsers taking more than one
+    outpaths: list of output paths, in the same order as inputs
+    workers: number of worker processes; None uses every core, 1 runs in this process
+    text_input: if True, read each input file and pass its contents to parse instead of the path
+    transform: optional function applied to each frame before it is written
+    kwargs: passed on to parse
+    '''
+
+    if len(inputs) != len(outpaths):
+        raise ValueError("Need exactly one output path per input")
+
+    if workers is None:
+        workers = os.cpu_count()
+
+    if workers == 1 or len(inputs) <= 1:
+        return [_ingest_one(parse, inp, out, text_input, transform, kwargs) for inp, out in zip(inputs, outpaths)]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(inputs))) as pool:
+        futures = [pool.submit(_ingest_one, parse, inp, out, text_input, transform, kwargs)
+                   for inp, out in zip(inputs, outpaths)]
+        return [f.result() for f in futures]
@@ -0,0 +1,165 @@
+# Readers for BookNLP output files that don't need the whole file in memory
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from hannstats.jsonstream import JSONStream
+
+_CHUNK_SIZE = 1024**2
+
+
+def _walk_characters(book_path, read_speaking, chunk_size):
+    # Yield (name, read_speaking(stream)) for every character of a .book file, decoding only the first
+    # name; read_speaking reads the 'speaking' value off the stream, and everything else is skipped
+    with open(book_path) as fp:
+        stream = JSONStream(fp, chunk_size)
+        if not stream.find_key('characters'):
+            return
+        for _ in stream.elements():
+            name, speaking = None, None
+            for key in stream.keys():
+                if key == 'names':
+                    for i, _ in enumerate(stream.elements()):
+                        if i == 0:
+                            name = stream.value()['n']
+                        else:
+                            stream.skip()
+                elif key == 'speaking':
+                    speaking = read_speaking(stream)
+                else:
+                    stream.skip()
+            yield name, speaking
+
+def _read_quotes(stream):
+    # The indices and texts of a character's quotes, decoding one quote at a time
+    indices, texts = [], []
+    for _ in stream.elements():
+        quote = stream.value()
+        indices.append(quote['i'])
+        texts.append(quote['w'])
+    return np.array(indices, dtype=np.int64), texts
+
+def iter_characters(book_path, chunk_size=_CHUNK_SIZE):
+    '''
+    Iterate over the characters of a .book file produced by booknlp, one at a time, without loading
+    the whole file. Yields (name, speaking) for each character, where name is the character's first
+    name ('names'[0]['n'], or None if it has no names) and speaking is its list of {'w', 'i'} quotes.
+    Only the first name and the quotes are decoded; the rest of each character (mentions, agent,
+    ...) is skipped over.
+
+    book_path: path to the .book file
+    '''
+
+    for name, speaking in _walk_characters(book_path, JSONStream.value, chunk_size):
+        yield name, speaking if speaking is not None else []
+
+def iter_quotes(book_path, chunk_size=_CHUNK_SIZE):
+    # Like iter_characters, but yields (name, indices, texts) with each character's quote indices as an
+    # int64 array and their texts as a list, so the quotes are never held as dicts
+    for name, quotes in _walk_characters(book_path, _read_quotes, chunk_size):
+        indices, texts = quotes if quotes is not None else (np.array([], dtype=np.int64), [])
+        yield name, indices, texts
+
+def load_character_names(book_path):
+    # List of the first name of every character in a .book file (None for characters without names),
+    # indexed the same way as booknlp's character ids
+    return [name for name, _ in iter_characters(book_path)]
+
+
+def read_tokens(tokens_path):
+    # Read a booknlp .tokens file, keeping characterId as text so 'O' and '-1' compare as written
+    return pd.read_csv(tokens_path, sep='\t', dtype={'characterId': str})
+
+def convert_tokens(tokens_path, book_path, store_path):
+    '''
+    Convert a booknlp .tokens file into a token store: a directory holding one .npy array per column,
+    so that later runs can memory-map the columns instead of parsing the file again. Integer columns
+    are stored as they are (characterId too, if it holds only integers). Text columns are stored as
+    integer codes into a per-column dictionary of strings, with -1 for missing values. The first name
+    of every character in the matching .book file is stored alongside.
+
+    tokens_path: path to the .tokens file
+    book_path: path to the matching .book file
+    store_path: directory to write the store to
+    '''
+
+    tok = read_tokens(tokens_path)
+    os.makedirs(store_path, exist_ok=True)
+
+    columns = {}
+    dictionary = {}
+    for name in tok.columns:
+        col = tok[name]
+        if name == 'characterId':
+            ints = pd.to_numeric(col, errors='coerce')
+            if not ints.isna().any():
+                col = ints.astype(np.int64)
+
+        if pd.api.types.is_integer_dtype(col):
+            values = col.to_numpy()
+            if values.size == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+                values = values.astype(np.int32)
+            columns[name] = 'int'
+        else:
+            values, strings = pd.factorize(col)
+            values = values.astype(np.int32)
+            dictionary[name] = [str(s) for s in strings]
+            columns[name] = 'str'
+        np.save(os.path.join(store_path, name + '.npy'), values)
+
+    meta = {"columns": columns, "rows": len(tok)}
+    with open(os.path.join(store_path, 'meta.json'), 'w') as fp:
+        json.dump(meta, fp)
+    with open(os.path.join(store_path, 'dictionary.json'), 'w') as fp:
+        json.dump(dictionary, fp)
+    with open(os.path.join(store_path, 'characters.json'), 'w') as fp:
+        json.dump(load_character_names(book_path), fp)
+
+
+class TokenStore:
+    '''
+    A token store written by convert_tokens. Columns are memory-mapped when first asked for, so
+    nothing is read or copied up front.
+
+    store_path: directory of the store
+    '''
+
+    def __init__(self, store_path):
+        self.path = store_path
+        with open(os.path.join(store_path, 'meta.json')) as fp:
+            meta = json.load(fp)
+        self.columns = meta['columns']
+        self.rows = meta['rows']
+        self._dictionary = None
+        self._character_names = None
+
+    def __len__(self):
+        return self.rows
+
+    def codes(self, name):
+        # The raw column: values for integer columns, dictionary codes for text columns
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+    def strings(self, name):
+        # The dictionary of a text column
+        if self._dictionary is None:
+            with open(os.path.join(self.path, 'dictionary.json')) as fp:
+                self._dictionary = json.load(fp)
+        return self._dictionary[name]
+
+    def column(self, name):
+        # A column as a pandas series, with text columns decoded
+        codes = self.codes(name)
+        if self.columns[name] == 'int':
+            return pd.Series(codes, name=name, copy=False)
+        strings = np.array(self.strings(name) + [np.nan], dtype=object)
+        return pd.Series(strings[codes], name=name)
+
+    @property
+    def character_names(self):
+        if self._character_names is None:
+            with open(os.path.join(self.path, 'characters.json')) as fp:
+                self._character_names = json.load(fp)
+        return self._character_names
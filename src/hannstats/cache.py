@@ -0,0 +1,245 @@
+# Content-addressed on-disk cache for parsed dialog tables and networks
+
+import os
+import hashlib
+import pickle
+import sys
+import shutil
+import tempfile
+from functools import partial
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hannstats")
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+_CHUNK_SIZE = 1024**2
+
+
+def _file_digest(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _dir_digest(path):
+    # A directory (e.g. a token store) is keyed on the names and contents of its files
+    h = hashlib.blake2b(digest_size=20)
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            h.update(os.path.relpath(full, path).encode('utf-8'))
+            h.update(_file_digest(full).encode('utf-8'))
+    return h.hexdigest()
+
+def _stat_digest(path):
+    # A cheaper stand-in for the content digest of a file or directory: the names, sizes and
+    # modification times of its files, without reading any of them
+    h = hashlib.blake2b(digest_size=20)
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            files += [os.path.join(root, name) for name in sorted(names)]
+    for full in files:
+        stat = os.stat(full)
+        h.update(f"{os.path.relpath(full, path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return h.hexdigest()
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_code_digests = {}
+
+def _code_digest(func):
+    # Results are keyed on the code that produced them: the source of every hannstats module (a
+    # parser calls into the others), and the source of func's own module if it lives elsewhere
+    module = sys.modules.get(func.__module__)
+    path = getattr(module, '__file__', None)
+    if path is not None and os.path.dirname(os.path.abspath(path)) == _PACKAGE_DIR:
+        path = None
+    if path not in _code_digests:
+        h = hashlib.blake2b(digest_size=20)
+        sources = [os.path.join(_PACKAGE_DIR, name) for name in sorted(os.listdir(_PACKAGE_DIR)) if name.endswith('.py')]
+        for source in sources + ([path] if path is not None else []):
+            h.update(_file_digest(source).encode('utf-8'))
+        _code_digests[path] = h.hexdigest()
+    return _code_digests[path]
+
+def _arg_digest(arg, by_stat=False):
+    # Paths to files are keyed on what is in them, so edits to a screenplay, a
+    # .tokens file or character_bins.json all change the key. Directories are
+    # keyed on the files inside them, and lists of paths on each of them. Other
+    # strings are hashed as-is and anything else by its repr. With by_stat,
+    # files and directories are keyed on _stat_digest instead.
+    if isinstance(arg, str):
+        if by_stat and (os.path.isfile(arg) or os.path.isdir(arg)):
+            return 'stat:' + _stat_digest(arg)
+        if os.path.isfile(arg):
+            return 'file:' + _file_digest(arg)
+        if os.path.isdir(arg):
+            return 'dir:' + _dir_digest(arg)
+        return 'str:' + hashlib.blake2b(arg.encode('utf-8'), digest_size=20).hexdigest()
+    if isinstance(arg, (list, tuple)):
+        return 'list:' + ','.join(_arg_digest(x, by_stat) for x in arg)
+    return 'repr:' + repr(arg)
+
+
+class DiskCache:
+    '''
+    Cache function results on disk, keyed by a hash of the function, its arguments (file arguments by
+    content) and the source code of hannstats, so editing the code invalidates earlier results.
+    Results are pickled, or written as a directory of files with put_dir. When the cache grows past
+    max_bytes the least recently used entries are dropped.
+
+    path: directory to keep the cache in
+    max_bytes: size limit for the cache directory
+    by_stat: key file and directory arguments on the names, sizes and modification times of their
+             files instead of their contents, so that checking the cache doesn't read large inputs
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, by_stat=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.by_stat = by_stat
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, func, *args, **kwargs):
+        return self.content_key([func.__module__, func.__qualname__, _code_digest(func)], *args, **kwargs)
+
+    def content_key(self, labels, *args, **kwargs):
+        # Key for anything other than a hannstats function call: labels (strings naming what is cached
+        # and the version of the code making it) plus the arguments, hashed as in key
+        parts = list(labels)
+        parts += [_arg_digest(arg, self.by_stat) for arg in args]
+        parts += [f"{name}={_arg_digest(kwargs[name], self.by_stat)}" for name in sorted(kwargs)]
+        return hashlib.blake2b('\n'.join(parts).encode('utf-8'), digest_size=20).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def _entry_dir(self, key):
+        return os.path.join(self.path, key + '.d')
+
+    def get(self, key):
+        # Returns None on a miss. A hit counts as a use for eviction.
+        entry = self._entry(key)
+        try:
+            with open(entry, 'rb') as fp:
+                value = pickle.load(fp)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            # e.g. a read-only cache: the hit still counts, it just isn't recorded for eviction
+            pass
+        return value
+
+    def put(self, key, value):
+        # Write to a temporary file first so other processes never see half an entry
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        entry = self._entry(key)
+        os.replace(tmp, entry)
+        self.evict(keep=entry)
+
+    def get_dir(self, key):
+        # Path of a directory entry (see put_dir), or None on a miss. A hit counts as a use for eviction.
+        entry = self._entry_dir(key)
+        if not os.path.isdir(entry):
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return entry
+
+    def put_dir(self, key, write):
+        '''
+        Make a directory entry, for results that are several files rather than one picklable value
+        (e.g. saved models). write(path) is called with an empty temporary directory to write the
+        files to, which then becomes the entry; if write fails the temporary directory is removed.
+        Directory entries count towards max_bytes like any other entry. Returns the entry's path.
+        '''
+
+        tmp = tempfile.mkdtemp(dir=self.path, suffix='.tmp')
+        try:
+            write(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        entry = self._entry_dir(key)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process made the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(entry):
+                raise
+        self.evict(keep=entry)
+        return entry
+
+    def _remove(self, path):
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _size(self, path):
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+        return os.path.getsize(path)
+
+    def evict(self, keep=None):
+        # Drop least recently used entries until the cache fits in max_bytes. keep (the path of an
+        # entry just written) is never dropped, even if it is larger than max_bytes on its own, so
+        # the caller can still read it.
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.path == keep:
+                continue
+            try:
+                if entry.name.endswith('.pkl') or (entry.name.endswith('.d') and entry.is_dir()):
+                    stat = entry.stat()
+                    size = self._size(entry.path)
+                else:
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, size, entry.path))
+
+        total = sum(size for _, size, _ in entries) + (self._size(keep) if keep is not None else 0)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl') or entry.name.endswith('.d'):
+                self._remove(entry.path)
+
+    def call(self, func, *args, **kwargs):
+        # Return func(*args, **kwargs), from the cache if it has been computed before
+        key = self.key(func, *args, **kwargs)
+        value = self.get(key)
+        if value is None:
+            value = func(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+
+def cached(func, path=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, by_stat=False):
+    '''
+    Wrap a parser, e.g. utils.screenplay_to_dialog_table, utils.load_bnlp_dialog,
+    utils.tokens_to_network or utils.script_to_network, so that its results are cached on disk.
+    The wrapper can be pickled, so it can be handed to batch.ingest. See DiskCache for by_stat.
+    '''
+    return partial(DiskCache(path, max_bytes, by_stat).call, func)
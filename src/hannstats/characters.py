@@ -0,0 +1,151 @@
+# Resolving character names and aliases to their character bins (character_bins.json)
+
+import os
+import json
+import regex
+import numpy as np
+import pandas as pd
+from collections import Counter, defaultdict
+
+_RESOLVERS = {}
+_NOT_WORD = regex.compile(r"[^\w ]+")
+_SPACES = regex.compile(r" +")
+
+
+def _normalize(name):
+    # Lowercase, drop punctuation and squeeze spaces, so "Dr. Lecter" and "dr lecter" compare equal
+    name = _NOT_WORD.sub("", name.lower())
+    return _SPACES.sub(" ", name).strip()
+
+def _ngrams(name, n):
+    padded = f" {name} "
+    return set(padded[i:i+n] for i in range(max(len(padded) - n + 1, 1)))
+
+
+class AliasIndex:
+    '''
+    Character n-gram inverted index over the aliases of the character bins, for matching name variants
+    that aren't listed as aliases ("Hannibal L.", "Dr Lecter"). A query only scores the aliases sharing
+    at least one n-gram with it, rather than every alias.
+
+    aliases: dict of alias to bin name
+    n: n-gram length
+    threshold: smallest Dice similarity (2 * shared n-grams / total n-grams) that counts as a match
+    '''
+
+    def __init__(self, aliases, n=3, threshold=0.75):
+        self.n = n
+        self.threshold = threshold
+        self.aliases = []
+        self.bins = []
+        self.sizes = []
+        self.postings = defaultdict(list)
+        for alias, name in aliases.items():
+            grams = _ngrams(_normalize(alias), n)
+            for gram in grams:
+                self.postings[gram].append(len(self.aliases))
+            self.aliases.append(alias)
+            self.bins.append(name)
+            self.sizes.append(len(grams))
+
+    def match(self, name):
+        # Best matching (bin, alias, score) for a name, or None if nothing reaches the threshold.
+        # Ties go to the alias listed first.
+        grams = _ngrams(_normalize(name), self.n)
+        shared = Counter(i for gram in grams for i in self.postings.get(gram, ()))
+        best = None
+        for i, count in shared.items():
+            score = 2 * count / (len(grams) + self.sizes[i])
+            if score >= self.threshold and (best is None or score > best[0] or (score == best[0] and i < best[1])):
+                best = (score, i)
+        if best is None:
+            return None
+        score, i = best
+        return self.bins[i], self.aliases[i], score
+
+
+class CharacterResolver:
+    '''
+    Maps names to their character bin. Lookups are case-insensitive. A name that isn't in any bin
+    falls back to either itself ('keep'), its lowercase form ('lower') or its title case form ('title').
+    Every name resolved is remembered, so each distinct name is only looked up once.
+
+    With a fuzzy threshold, names that aren't aliases are also matched against the aliases by
+    n-gram similarity (see AliasIndex) before falling back. Names binned that way are recorded
+    for review in auto_binned.
+
+    bins: dict of bin name to list of lowercase aliases, as in character_bins.json
+    fuzzy: similarity threshold for fuzzy matching, or None for exact aliases only
+    '''
+
+    def __init__(self, bins, fuzzy=None):
+        self.aliases = {alias: name for name, aliases in bins.items() for alias in aliases}
+        self.index = AliasIndex(self.aliases, threshold=fuzzy) if fuzzy is not None else None
+        self.auto_binned = {}
+        self._memo = {'keep': {}, 'lower': {}, 'title': {}}
+
+    def _match(self, key):
+        # Bin for a lowercased name that isn't an alias, or None
+        if self.index is None:
+            return None
+        if key not in self.auto_binned:
+            self.auto_binned[key] = self.index.match(key)
+        match = self.auto_binned[key]
+        return match[0] if match is not None else None
+
+    def resolve_one(self, name, fallback='keep'):
+        memo = self._memo[fallback]
+        if name not in memo:
+            key = name.lower()
+            if key in self.aliases:
+                memo[name] = self.aliases[key]
+            elif self._match(key) is not None:
+                memo[name] = self._match(key)
+            elif fallback == 'lower':
+                memo[name] = key
+            elif fallback == 'title':
+                memo[name] = name.title()
+            else:
+                memo[name] = name
+        return memo[name]
+
+    def resolve(self, names, fallback='keep'):
+        # Resolve a series, array or list of names at once: each distinct name is resolved once and the
+        # results are spread back out by code. Missing values stay missing. Series come back as series
+        # with the same index, anything else as an object array.
+        if not isinstance(names, (pd.Series, pd.Index, np.ndarray)):
+            names = np.array(names, dtype=object)
+        codes, uniques = pd.factorize(names)
+        resolved = np.array([self.resolve_one(name, fallback) for name in uniques] + [np.nan], dtype=object)
+        result = resolved[codes]
+        if isinstance(names, pd.Series):
+            return pd.Series(result, index=names.index, name=names.name, dtype=object)
+        return result
+
+    def report(self):
+        # The names that were binned by fuzzy matching, with the alias they matched, best matches first
+        rows = [(name, match[0], match[1], match[2]) for name, match in self.auto_binned.items() if match is not None]
+        df = pd.DataFrame(rows, columns=["name", "bin", "alias", "score"])
+        return df.sort_values(["score", "name"], ascending=[False, True], ignore_index=True)
+
+def get_resolver(character_bins, fuzzy=None):
+    '''
+    The resolver for a character bins file. Resolvers are kept for the life of the process and only
+    rebuilt when the file changes, so callers can ask for one on every call. A resolver passed in is
+    returned as is.
+
+    character_bins: path to a character_bins.json file, or a CharacterResolver
+    fuzzy: similarity threshold for fuzzy alias matching, or None for exact aliases only
+    '''
+
+    if isinstance(character_bins, CharacterResolver):
+        return character_bins
+
+    path = os.path.abspath(character_bins)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _RESOLVERS.get((path, fuzzy))
+    if cached is None or cached[0] != mtime:
+        with open(path) as fp:
+            cached = (mtime, CharacterResolver(json.load(fp), fuzzy))
+        _RESOLVERS[(path, fuzzy)] = cached
+    return cached[1]
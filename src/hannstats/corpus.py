@@ -0,0 +1,95 @@
+# Packed corpora: many texts in one file, so that reading a corpus doesn't mean opening thousands of small files.
+#
+# A pack is a directory (named <something>.pack by convention) holding
+#   texts.bin    every text, utf-8 encoded, one after the other
+#   offsets.npy  int64 byte offsets into texts.bin, one more than there are texts
+#   ids.json     the id of every text, in the same order
+
+import os
+import json
+import mmap
+import numpy as np
+
+_BLOB = 'texts.bin'
+_OFFSETS = 'offsets.npy'
+_IDS = 'ids.json'
+
+
+def write_pack(items, path):
+    '''
+    Write texts to a pack, one at a time.
+
+    items: iterable of (id, text)
+    path: directory to write the pack to
+    '''
+
+    os.makedirs(path, exist_ok=True)
+    ids = []
+    offsets = [0]
+    with open(os.path.join(path, _BLOB), 'wb') as fp:
+        for text_id, text in items:
+            data = text.encode('utf-8')
+            fp.write(data)
+            ids.append(str(text_id))
+            offsets.append(offsets[-1] + len(data))
+
+    np.save(os.path.join(path, _OFFSETS), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(path, _IDS), 'w') as fp:
+        json.dump(ids, fp)
+
+def index_files(path):
+    # The files of a pack that say which texts it holds and where they are; they are small, so a
+    # cache can hash them to notice a changed pack without reading the texts
+    return [os.path.join(path, _OFFSETS), os.path.join(path, _IDS)]
+
+def texts_stamp(path):
+    # Size and modification time of a pack's texts.bin, so a cache key notices texts rewritten in
+    # place (with the index left alone) without reading them
+    stat = os.stat(os.path.join(path, _BLOB))
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def is_pack(path):
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, _OFFSETS))
+
+
+class PackedCorpus:
+    '''
+    Read a pack written by write_pack. The texts are memory-mapped, so opening a pack reads only its
+    index, and a single text can be looked up by id without reading the others.
+
+    path: directory of the pack
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = np.load(os.path.join(path, _OFFSETS), mmap_mode='r')
+        with open(os.path.join(path, _IDS)) as fp:
+            self.ids = json.load(fp)
+        self._index = {text_id: i for i, text_id in enumerate(self.ids)}
+
+        with open(os.path.join(path, _BLOB), 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size > 0:
+                self._blob = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # mmap can't map an empty file
+                self._blob = b''
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, text_id):
+        return text_id in self._index
+
+    def raw(self, text_id):
+        # The utf-8 bytes of a text, as a view into the mapped file (no copy)
+        i = self._index[text_id]
+        return memoryview(self._blob)[self.offsets[i]:self.offsets[i+1]]
+
+    def __getitem__(self, text_id):
+        return str(self.raw(text_id), 'utf-8')
+
+    def __iter__(self):
+        # (id, text) for every text, in the order they were written
+        view = memoryview(self._blob)
+        for i, text_id in enumerate(self.ids):
+            yield text_id, str(view[self.offsets[i]:self.offsets[i+1]], 'utf-8')
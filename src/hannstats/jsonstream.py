@@ -0,0 +1,172 @@
+# Streaming reader for large JSON files (booknlp .book files, AO3 scrapes), so that only the values
+# that are needed are ever decoded or held in memory
+
+import re
+import json
+from json.decoder import scanstring
+
+_CHUNK_SIZE = 1024**2
+_WHITESPACE = ' \t\n\r'
+
+# The next bracket or string
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+# A number, true, false or null
+_SCALAR = re.compile(r'[^\s,\]}]*')
+
+
+class JSONStream:
+    '''
+    Event-based reader for a JSON file: arrays and objects are walked one element or key at a time,
+    and each value is either decoded (value) or skipped without being built (skip). Skipping keeps
+    only one read's worth of the file in memory, so memory is bounded by the read size and the
+    largest value actually decoded. Reads grow with the value being read, so a large value is found
+    in a linear number of steps and decoded once.
+
+    fp: file opened in text mode
+    chunk_size: smallest number of characters read at a time
+    '''
+
+    def __init__(self, fp, chunk_size=_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # Drop what has been consumed and read more: at least chunk_size, and as much again as is
+        # left unconsumed, so a value that keeps running past the end of the buffer doubles it
+        remaining = len(self.buf) - self.pos
+        chunk = self.fp.read(max(self.chunk_size, remaining))
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        # Next non-whitespace character, or '' at the end of the file
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos+1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} of the buffer")
+        self.pos += 1
+
+    def _scan(self, i, depth):
+        # Move through the buffer from i, depth brackets deep, until the value the scan started on
+        # ends. Returns (i, depth, done); when not done, the scan can carry on from i after a refill.
+        buf = self.buf
+        while True:
+            m = _STRUCTURAL.search(buf, i)
+            if m is None:
+                return len(buf), depth, False
+            if m.group() == '"':
+                # json's own (C) string scanner is much faster than a regex at finding where a string ends
+                try:
+                    _, i = scanstring(buf, m.end())
+                except json.JSONDecodeError:
+                    return m.start(), depth, False
+            elif m.group() in '[{':
+                depth += 1
+                i = m.end()
+                continue
+            else:
+                depth -= 1
+                i = m.end()
+            if depth == 0:
+                return i, depth, True
+
+    def _end(self, keep):
+        # Offset in the buffer just past the next value. With keep=False everything before the scan
+        # position is dropped on a refill, so the value can't be decoded afterwards.
+        if self.peek() not in '[{"':
+            while True:
+                end = _SCALAR.match(self.buf, self.pos).end()
+                if end < len(self.buf) or self.eof:
+                    return end
+                self._fill()
+
+        i, depth = self.pos, 0
+        while True:
+            i, depth, done = self._scan(i, depth)
+            if done:
+                return i
+            if self.eof:
+                raise ValueError("Unexpected end of JSON")
+            if not keep:
+                self.pos = i
+            shift = self.pos
+            self._fill()
+            i -= shift
+
+    def value(self):
+        # Decode the next value. If it doesn't fit in the buffer, find its end first and decode it
+        # once it is all in, rather than decoding it again after every read.
+        self.peek()
+        try:
+            value, end = self.decoder.raw_decode(self.buf, self.pos)
+            # A number that runs up against the end of the buffer may be cut off
+            if end < len(self.buf) or self.eof:
+                self.pos = end
+                return value
+        except json.JSONDecodeError:
+            if self.eof:
+                raise
+        self._end(keep=True)
+        value, self.pos = self.decoder.raw_decode(self.buf, self.pos)
+        return value
+
+    def skip(self):
+        # Move past the next value without decoding it
+        self.pos = self._end(keep=False)
+
+    def elements(self):
+        # Walk the array starting here. Each step stops on an element, which the caller must read
+        # (value, skip, elements or keys) before asking for the next one.
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+    def keys(self):
+        # Walk the object starting here, yielding each key. The caller must read the key's value
+        # before asking for the next key.
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            name = self.value()
+            self.expect(':')
+            yield name
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
+
+    def items(self):
+        # Decode the values of the array starting here, one at a time
+        for _ in self.elements():
+            yield self.value()
+
+    def find_key(self, key):
+        # Move to the value of a key of the object starting here, skipping the values before it
+        for name in self.keys():
+            if name == key:
+                return True
+            self.skip()
+        return False
@@ -0,0 +1,229 @@
+# Building up weighted character networks
+
+import os
+import numpy as np
+import pandas as pd
+
+
+class EdgeAccumulator:
+    '''
+    Collects weighted edges between characters. Names are interned to integer ids and edges are kept
+    as arrays of (source id, target id, weight), in the order they were added. Adding the same edge
+    again adds to its weight. Accumulators can be merged, e.g. to combine the networks of several
+    shards of a text.
+
+    Edges come out grouped by source, in order of each source's first edge, and within a source in
+    order of first appearance: the same order as counting them up in a dict of Counters.
+
+    names: optional names to intern up front, so that their ids are 0, 1, ... in that order
+    '''
+
+    def __init__(self, names=None):
+        self.names = []
+        self._ids = {}
+        self._chunks = []
+        self._compact = True
+        if names is not None:
+            self.intern(names)
+
+    def __len__(self):
+        return len(self.edges()[0])
+
+    def intern(self, names):
+        # Integer ids for an array of names, giving new names the next free ids
+        names = np.asarray(names, dtype=object)
+        codes, uniques = pd.factorize(names)
+        ids = np.empty(len(uniques), dtype=np.int64)
+        for i, name in enumerate(uniques):
+            if name not in self._ids:
+                self._ids[name] = len(self.names)
+                self.names.append(name)
+            ids[i] = self._ids[name]
+        return ids[codes]
+
+    def add_ids(self, source, target, weight=1):
+        # Add edges between already interned ids. weight can be one number for all of them.
+        source = np.asarray(source, dtype=np.int64)
+        target = np.asarray(target, dtype=np.int64)
+        weight = np.broadcast_to(np.asarray(weight, dtype=np.int64), source.shape)
+        if len(source) > 0:
+            self._chunks.append((source, target, weight))
+            self._compact = False
+
+    def add_pairs(self, source, target, weight=1):
+        # Add edges between names
+        self.add_ids(self.intern(source), self.intern(target), weight)
+
+    def merge(self, other):
+        # Add all the edges of another accumulator to this one, after this one's edges
+        source, target, weight = other.edges()
+        if len(source) > 0:
+            ids = self.intern(other.names)
+            self.add_ids(ids[source], ids[target], weight)
+        return self
+
+    def edges(self):
+        # Source ids, target ids and summed weights of every distinct edge, in output order
+        if len(self._chunks) == 0:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty
+        if self._compact:
+            return self._chunks[0]
+
+        source, target, weight = [np.concatenate(x) for x in zip(*self._chunks)]
+        n = max(len(self.names), 1)
+        keys, first, inverse = np.unique(source * n + target, return_index=True, return_inverse=True)
+        sums = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(sums, inverse, weight)
+
+        # Order of first appearance, then grouped by source
+        order = np.argsort(first)
+        keys, sums = keys[order], sums[order]
+        source, target = keys // n, keys % n
+        source_order, _ = pd.factorize(source)
+        order = np.argsort(source_order, kind='stable')
+
+        self._chunks = [(source[order], target[order], sums[order])]
+        self._compact = True
+        return self._chunks[0]
+
+    def to_frame(self):
+        # The network as a source/target/type/weight graph frame
+        source, target, weight = self.edges()
+        names = np.array(self.names, dtype=object)
+        df = pd.DataFrame({"source": names[source],
+                           "target": names[target],
+                           "type": "undirected",
+                           "weight": weight})
+        return df
+
+
+def _network_paths(paths):
+    # A directory stands for every file in it, in name order
+    if isinstance(paths, str):
+        return [os.path.join(paths, fname) for fname in sorted(os.listdir(paths))]
+    return list(paths)
+
+def canonical_pairs(source, target):
+    # Put the endpoints of undirected edges in a fixed order (the name that sorts first as source),
+    # so that A-B and B-A count as the same edge
+    source = np.asarray(source, dtype=object)
+    target = np.asarray(target, dtype=object)
+    swap = source > target
+    return np.where(swap, target, source), np.where(swap, source, target)
+
+def prune(df, min_weight=None, top_k=None):
+    '''
+    Drop the light edges of a graph frame, keeping the order of the rest.
+
+    df: graph frame with a weight column
+    min_weight: drop edges lighter than this
+    top_k: keep only the k heaviest edges (ties go to the earlier edge)
+    '''
+
+    if min_weight is not None:
+        df = df[df['weight'] >= min_weight]
+    if top_k is not None and len(df) > top_k:
+        df = df.nlargest(top_k, 'weight', keep='first').sort_index()
+    return df.reset_index(drop=True)
+
+def aggregate_networks(paths, undirected=True, min_weight=None, top_k=None):
+    '''
+    Combine network files (e.g. one per episode or per novel) into one network, summing the weights of
+    edges that show up in more than one file. Files are read one at a time and folded into an
+    EdgeAccumulator, so only the combined network is kept in memory. Pruning happens after summing.
+
+    paths: list of .tsv network files, or a directory of them
+    undirected: if True, A-B and B-A are the same edge (see canonical_pairs)
+    min_weight, top_k: see prune
+    '''
+
+    edges = EdgeAccumulator()
+    for path in _network_paths(paths):
+        df = pd.read_csv(path, sep='\t', dtype={'source': str, 'target': str})
+        source = df['source'].to_numpy(dtype=object)
+        target = df['target'].to_numpy(dtype=object)
+        if undirected:
+            source, target = canonical_pairs(source, target)
+        edges.add_pairs(source, target, df['weight'].to_numpy())
+        # Sum as we go, so the accumulator never holds more than the combined network and one file
+        edges.edges()
+
+    return prune(edges.to_frame(), min_weight, top_k)
+
+
+class TemporalNetwork:
+    '''
+    A network that grows step by step (e.g. one episode at a time). Each step's edges are kept as a
+    delta, and a running EdgeAccumulator holds the network so far, so adding a step only costs the
+    size of that step. Cumulative snapshots for earlier steps are rebuilt from the deltas.
+    '''
+
+    def __init__(self):
+        self.labels = []
+        self._deltas = []
+        self._running = EdgeAccumulator()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add_step(self, df, label=None):
+        # Add the graph frame of the next step. Returns the running network after it.
+        edges = EdgeAccumulator()
+        edges.add_pairs(df['source'].to_numpy(dtype=object), df['target'].to_numpy(dtype=object),
+                        df['weight'].to_numpy())
+        source, target, weight = edges.edges()
+        ids = self._running.intern(edges.names)
+        self._deltas.append((ids[source], ids[target], weight))
+        self._running.add_ids(ids[source], ids[target], weight)
+        self.labels.append(label if label is not None else len(self.labels))
+        return self._running
+
+    def _frame(self, source, target, weight):
+        names = np.array(self._running.names, dtype=object)
+        return pd.DataFrame({"source": names[source],
+                             "target": names[target],
+                             "type": "undirected",
+                             "weight": weight})
+
+    def delta(self, step):
+        # Graph frame of the edges added at one step
+        return self._frame(*self._deltas[step])
+
+    def snapshot(self, step=-1):
+        # Graph frame of the network as of a step (the latest by default), counting every step up to it
+        step = range(len(self._deltas))[step]
+        if step == len(self._deltas) - 1:
+            return self._frame(*self._running.edges())
+        edges = EdgeAccumulator(self._running.names)
+        for source, target, weight in self._deltas[:step+1]:
+            edges.add_ids(source, target, weight)
+        return self._frame(*edges.edges())
+
+    def snapshots(self):
+        # (label, cumulative graph frame) for every step, built up one delta at a time
+        edges = EdgeAccumulator(self._running.names)
+        for label, (source, target, weight) in zip(self.labels, self._deltas):
+            edges.add_ids(source, target, weight)
+            yield label, self._frame(*edges.edges())
+
+    def to_frame(self):
+        # All the deltas in one long frame with a step column. Running totals per edge are in the
+        # cumulative column, so the snapshot of any step is the last row of each edge up to that step.
+        # Steps that added no edges have no rows.
+        frames = []
+        for label, delta in zip(self.labels, self._deltas):
+            frames.append(self._frame(*delta).assign(step=label))
+        if not frames:
+            return pd.DataFrame({"source": [], "target": [], "type": [], "weight": [], "step": [], "cumulative": []})
+        df = pd.concat(frames, ignore_index=True)
+        df['cumulative'] = df.groupby(['source', 'target'], sort=False)['weight'].cumsum()
+        return df
+
+    @classmethod
+    def from_frame(cls, df):
+        # Rebuild a temporal network from the long frame written by to_frame
+        temporal = cls()
+        for label, delta in df.groupby('step', sort=False):
+            temporal.add_step(delta, label)
+        return temporal
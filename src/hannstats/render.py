@@ -0,0 +1,131 @@
+# Rendering large character networks: backbone extraction, offline layout and static HTML pages
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+def disparity_filter(df, alpha=0.05):
+    '''
+    Keep the backbone of a weighted undirected graph frame: the edges that carry a significant share
+    of the weight of at least one of their endpoints under the disparity filter (Serrano, Boguna and
+    Vespignani 2009). An edge (i, j) is kept if (1 - w_ij / s_i) ** (k_i - 1) < alpha for i or j,
+    where s_i is the total weight and k_i the degree of i. Edges of nodes with one edge only count
+    from the other side.
+
+    df: graph frame with source, target and weight columns, one row per edge
+    alpha: significance level; smaller keeps fewer edges
+    '''
+
+    codes, names = pd.factorize(pd.concat([df['source'], df['target']], ignore_index=True))
+    source, target = codes[:len(df)], codes[len(df):]
+    weight = df['weight'].to_numpy(dtype=np.float64)
+
+    strength = np.bincount(source, weight, len(names)) + np.bincount(target, weight, len(names))
+    degree = np.bincount(source, minlength=len(names)) + np.bincount(target, minlength=len(names))
+
+    def significance(node):
+        p = weight / strength[node]
+        return np.where(degree[node] > 1, (1 - p) ** (degree[node] - 1), 1.0)
+
+    keep = (significance(source) < alpha) | (significance(target) < alpha)
+    return df[keep].reset_index(drop=True)
+
+def spring_layout(df, seed=0, iterations=50):
+    '''
+    Force-directed (Fruchterman-Reingold) layout of a graph frame, with heavier edges pulling harder.
+    The same frame and seed always give the same layout. Returns a frame of node, x and y, with
+    coordinates scaled to [-1, 1].
+
+    df: graph frame with source, target and weight columns
+    seed: seed for the starting positions
+    iterations: number of steps to run the simulation for
+    '''
+
+    codes, names = pd.factorize(pd.concat([df['source'], df['target']], ignore_index=True))
+    n = len(names)
+    source, target = codes[:len(df)], codes[len(df):]
+    weight = df['weight'].to_numpy(dtype=np.float64)
+
+    adjacency = np.zeros((n, n))
+    if len(weight) > 0:
+        np.add.at(adjacency, (source, target), weight / weight.max())
+        adjacency = adjacency + adjacency.T
+
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2))
+    if n > 1:
+        k = np.sqrt(1.0 / n)
+        temperature = 0.1
+        cooling = temperature / (iterations + 1)
+        for _ in range(iterations):
+            delta = pos[:, None, :] - pos[None, :, :]
+            distance = np.maximum(np.linalg.norm(delta, axis=-1), 0.01)
+            # Every pair of nodes pushes apart, every edge pulls together
+            force = k * k / distance**2 - adjacency * distance / k
+            displacement = np.einsum('ijk,ij->ik', delta, force)
+            length = np.linalg.norm(displacement, axis=-1)
+            length = np.where(length < 0.01, 0.1, length)
+            pos += displacement * (temperature / length)[:, None]
+            temperature -= cooling
+
+        pos -= pos.mean(axis=0)
+        pos /= max(np.abs(pos).max(), 1e-12)
+
+    return pd.DataFrame({"node": np.array(names, dtype=object), "x": pos[:, 0], "y": pos[:, 1]})
+
+def layout_path(network_path):
+    # Layouts are kept next to the network file they belong to
+    return os.path.splitext(network_path)[0] + '_layout.tsv'
+
+def cached_layout(network_path, seed=0, iterations=50):
+    '''
+    The spring layout of a network file, computed once and kept next to it (see layout_path). The
+    layout file records a hash of the network and the layout settings, and is recomputed when either
+    changes.
+
+    network_path: path to a .tsv graph frame
+    seed, iterations: see spring_layout
+    '''
+
+    with open(network_path, 'rb') as fp:
+        h = hashlib.blake2b(fp.read(), digest_size=20)
+    h.update(json.dumps({"seed": seed, "iterations": iterations}).encode('utf-8'))
+    key = h.hexdigest()
+
+    path = layout_path(network_path)
+    if os.path.isfile(path):
+        with open(path) as fp:
+            header = fp.readline().strip()
+        if header == f"# {key}":
+            return pd.read_csv(path, sep='\t', skiprows=1, dtype={'node': str})
+
+    df = pd.read_csv(network_path, sep='\t', dtype={'source': str, 'target': str})
+    layout = spring_layout(df, seed, iterations)
+    with open(path, 'w') as fp:
+        fp.write(f"# {key}\n")
+        layout.to_csv(fp, sep='\t', index=False)
+    return layout
+
+def render_html(df, layout, outpath, scale=1000):
+    '''
+    Write a pyvis page for a graph frame with the nodes fixed at precomputed positions and the physics
+    simulation turned off, so the browser only has to draw it.
+
+    df: graph frame with source, target and weight columns
+    layout: frame of node, x and y, e.g. from spring_layout or cached_layout
+    outpath: where to write the .html file
+    scale: size of the layout in pixels
+    '''
+
+    from pyvis.network import Network
+
+    net = Network(height='100%', width='100%', bgcolor='#222222', font_color='white')
+    for node, x, y in zip(layout['node'], layout['x'], layout['y']):
+        net.add_node(node, label=node, x=float(x) * scale, y=float(y) * scale, physics=False)
+    for source, target, weight in zip(df['source'], df['target'], df['weight']):
+        net.add_edge(source, target, value=float(weight))
+    net.toggle_physics(False)
+    net.write_html(outpath)
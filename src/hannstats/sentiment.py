@@ -0,0 +1,129 @@
+# Sentiment scoring for dialog tables, with scores kept on disk so each distinct line is only ever scored once
+
+import os
+import hashlib
+import sqlite3
+from functools import partial
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from hannstats.cache import DEFAULT_CACHE_DIR
+
+DEFAULT_SENTIMENT_CACHE = os.path.join(DEFAULT_CACHE_DIR, "sentiment.sqlite")
+
+_ANALYZER = None
+
+
+def vader_compound(text):
+    # VADER compound score of a text. The analyzer is made once per process.
+    global _ANALYZER
+    if _ANALYZER is None:
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        _ANALYZER = SentimentIntensityAnalyzer()
+    return _ANALYZER.polarity_scores(text)['compound']
+
+def _score_batch(scorer, texts):
+    return [scorer(text) for text in texts]
+
+def _scorer_name(scorer):
+    # A name for a scorer that stays the same across runs: module and qualified name for a function,
+    # and for a partial the name of its function along with its arguments. Other callables (e.g.
+    # instances of a class with __call__) fall back on their repr.
+    if isinstance(scorer, partial):
+        args = [repr(arg) for arg in scorer.args]
+        args += [f"{name}={value!r}" for name, value in sorted(scorer.keywords.items())]
+        return f"{_scorer_name(scorer.func)}({', '.join(args)})"
+    name = getattr(scorer, '__qualname__', None)
+    if name is None:
+        return repr(scorer)
+    return f"{getattr(scorer, '__module__', None)}.{name}"
+
+def _text_key(scorer_name, text):
+    # Scores are keyed on the scorer as well as the text, so different scorers never share entries
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{scorer_name}\n".encode('utf-8'))
+    h.update(text.encode('utf-8'))
+    return h.hexdigest()
+
+
+class SentimentCache:
+    '''
+    On-disk key-value store of sentiment scores, in an sqlite database.
+
+    path: path to the database file
+    '''
+
+    def __init__(self, path=DEFAULT_SENTIMENT_CACHE):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(sqlite3.connect(path)) as db, db:
+            db.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL)")
+
+    def get_many(self, keys, chunk_size=500):
+        # Dict of key to score for the keys that are in the cache
+        found = {}
+        with closing(sqlite3.connect(self.path)) as db:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start+chunk_size]
+                query = f"SELECT key, score FROM scores WHERE key IN ({','.join('?' * len(chunk))})"
+                found.update(db.execute(query, chunk).fetchall())
+        return found
+
+    def put_many(self, items):
+        # Store (key, score) pairs
+        with closing(sqlite3.connect(self.path)) as db, db:
+            db.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?)", items)
+
+
+def score_texts(texts, scorer=vader_compound, cache_path=DEFAULT_SENTIMENT_CACHE, workers=None, batch_size=1000,
+                scorer_name=None):
+    '''
+    Sentiment scores for a list of texts, in the same order. Each distinct text is scored once; scores
+    already in the cache are reused, and the rest are scored in batches across a process pool and
+    added to the cache. Missing texts (NaN) get NaN.
+
+    texts: list, array or series of texts
+    scorer: function of a text returning its score; must be picklable. Defaults to VADER's compound score.
+    cache_path: sqlite file to keep scores in, or None to not cache
+    workers: number of worker processes; None uses every core, 1 runs in this process
+    batch_size: number of texts sent to a worker at a time
+    scorer_name: name to key the scorer's cached scores on. By default it is made from the scorer's
+                 module and name (and a partial's arguments); give one for a callable object whose repr
+                 changes between runs.
+    '''
+
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object))
+    uniques = list(uniques)
+    if scorer_name is None:
+        scorer_name = _scorer_name(scorer)
+    keys = [_text_key(scorer_name, text) for text in uniques]
+
+    cache = SentimentCache(cache_path) if cache_path is not None else None
+    found = cache.get_many(keys) if cache is not None else {}
+    missing = [i for i, key in enumerate(keys) if key not in found]
+
+    if missing:
+        batches = [[uniques[i] for i in missing[start:start+batch_size]] for start in range(0, len(missing), batch_size)]
+        if workers is None:
+            workers = os.cpu_count()
+        if workers == 1 or len(batches) == 1:
+            scored = [_score_batch(scorer, batch) for batch in batches]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+                scored = list(pool.map(_score_batch, repeat(scorer), batches))
+        new = [(keys[i], score) for i, score in zip(missing, (s for batch in scored for s in batch))]
+        found.update(new)
+        if cache is not None:
+            cache.put_many(new)
+
+    scores = np.array([found[key] for key in keys] + [np.nan], dtype=np.float64)
+    return scores[codes]
+
+def add_sentiment(df, column='dialog', **kwargs):
+    # Add a sentiment column to a dialog table, scoring the text in column. kwargs go to score_texts.
+    df['sentiment'] = score_texts(df[column], **kwargs)
+    return df
@@ -0,0 +1,122 @@
+# One indexed table for the dialog of every corpus, so that picking out a character's lines is a slice
+# rather than a scan
+
+import numpy as np
+import pandas as pd
+
+
+def _group_bounds(*keys):
+    # Start and stop of every run of equal keys in sorted key arrays
+    change = np.zeros(len(keys[0]), dtype=bool)
+    if len(change) > 0:
+        change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(change)
+    stops = np.append(starts[1:], len(change))
+    return starts, stops
+
+
+class CorpusStore:
+    '''
+    Dialog tables from several corpora (e.g. novels, screenplays, fanfic) in one table, with corpus and
+    speaker as categorical columns. The table is sorted on corpus, speaker, item_num and line (the row
+    of the dialog in its own table), and the start and stop of every (corpus, speaker) and
+    (corpus, speaker, item_num) group are indexed, so selecting a character's dialog in a corpus or in
+    one item of it is a dictionary lookup and a slice, with rows in their original order.
+
+    df: table with corpus and speaker columns (and usually dialog); see also from_frames. Without an
+        item_num column every corpus is one item, numbered 0.
+    '''
+
+    def __init__(self, df):
+        if 'item_num' not in df.columns:
+            df = df.assign(item_num=0)
+        if 'line' not in df.columns:
+            df = df.assign(line=df.groupby(['corpus', 'item_num']).cumcount())
+
+        corpus = pd.Categorical(df['corpus'])
+        speaker = pd.Categorical(df['speaker'])
+        item_num = df['item_num'].to_numpy()
+        order = np.lexsort((df['line'].to_numpy(), item_num, speaker.codes, corpus.codes))
+
+        df = df.iloc[order].reset_index(drop=True)
+        df['corpus'] = corpus[order]
+        df['speaker'] = speaker[order]
+        self.frame = df
+
+        corpus_codes, speaker_codes, item_num = corpus.codes[order], speaker.codes[order], item_num[order]
+        corpora, speakers = corpus.categories, speaker.categories
+
+        self._corpus_index = {}
+        for start, stop in zip(*_group_bounds(corpus_codes)):
+            self._corpus_index[corpora[corpus_codes[start]]] = (start, stop)
+
+        self._speaker_index = {}
+        for start, stop in zip(*_group_bounds(corpus_codes, speaker_codes)):
+            if speaker_codes[start] >= 0:
+                self._speaker_index[(corpora[corpus_codes[start]], speakers[speaker_codes[start]])] = (start, stop)
+
+        self._item_index = {}
+        for start, stop in zip(*_group_bounds(corpus_codes, speaker_codes, item_num)):
+            if speaker_codes[start] >= 0:
+                key = (corpora[corpus_codes[start]], speakers[speaker_codes[start]], item_num[start])
+                self._item_index[key] = (start, stop)
+
+        self._item_sizes = df.groupby(['corpus', 'item_num'], observed=True).size().to_dict()
+
+    @classmethod
+    def from_frames(cls, corpora):
+        # Build a store from a dict of corpus name to list of dialog tables; each table's position in
+        # its list is its item_num
+        frames = []
+        for corpus, items in corpora.items():
+            for i, df in enumerate(items):
+                frames.append(df.assign(corpus=corpus, item_num=i, line=np.arange(len(df))))
+        return cls(pd.concat(frames, ignore_index=True))
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def corpora(self):
+        return list(self._corpus_index)
+
+    def speakers(self, corpus):
+        # Everyone who speaks in a corpus
+        return [speaker for c, speaker in self._speaker_index if c == corpus]
+
+    def speaker_counts(self, corpus, normalize=False):
+        # Number of lines of every speaker in a corpus, most first, read off the index. With normalize,
+        # each speaker's share of the lines instead (as in value_counts).
+        counts = {speaker: stop - start for (c, speaker), (start, stop) in self._speaker_index.items() if c == corpus}
+        counts = pd.Series(counts, dtype=np.int64).sort_values(ascending=False, kind='stable')
+        return counts / counts.sum() if normalize else counts
+
+    def item_size(self, corpus, item_num):
+        # Number of lines in one item (e.g. one episode) of a corpus
+        return self._item_sizes.get((corpus, item_num), 0)
+
+    def select(self, corpus, speaker=None, item_num=None):
+        '''
+        Rows of a corpus, optionally only those of one speaker and/or one item. Selecting a whole
+        corpus, or a speaker with or without an item, is a slice of the table. Selecting an item
+        without a speaker has to look through the corpus.
+
+        corpus: corpus name
+        speaker: speaker name
+        item_num: item number within the corpus
+        '''
+
+        if speaker is None:
+            start, stop = self._corpus_index.get(corpus, (0, 0))
+            rows = self.frame.iloc[start:stop]
+            if item_num is not None:
+                rows = rows[rows['item_num'] == item_num].sort_values('line')
+            return rows
+
+        if item_num is None:
+            start, stop = self._speaker_index.get((corpus, speaker), (0, 0))
+        else:
+            start, stop = self._item_index.get((corpus, speaker, item_num), (0, 0))
+        return self.frame.iloc[start:stop]
@@ -0,0 +1,191 @@
+# Reading and writing dialog tables (and other frames): tab-separated .tsv, or the columnar .dtab format
+#
+# A .dtab file is a run of compressed column chunks followed by a JSON footer describing them:
+#   b'HDTAB1' | row group 0 chunks | row group 1 chunks | ... | footer | footer length (uint64) | b'HDTAB1'
+# Rows are split into row groups and every column of a row group is stored on its own, so a reader only
+# reads and decompresses the columns it asks for. Columns are stored as
+#   dict  integer codes into a dictionary of strings kept in the footer (speakers); the footer also lists
+#         which codes appear in each row group, so groups without the speakers asked for are skipped
+#   num   the raw numpy array (ints, floats, bools), so types survive the round trip
+#   text  utf-8 bytes one after the other, with offsets and a missing-value mask
+# Every chunk is zlib compressed.
+
+import json
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+
+_MAGIC = b'HDTAB1'
+_LENGTH = struct.Struct('<Q')
+
+DTAB_EXTENSION = '.dtab'
+
+
+def _write_chunk(fp, array, level):
+    data = zlib.compress(np.ascontiguousarray(array).tobytes(), level)
+    offset = fp.tell()
+    fp.write(data)
+    return [offset, len(data)]
+
+def _read_chunk(fp, chunk, dtype):
+    offset, length = chunk
+    fp.seek(offset)
+    return np.frombuffer(zlib.decompress(fp.read(length)), dtype=dtype)
+
+def _column_kind(col):
+    if pd.api.types.is_bool_dtype(col) or pd.api.types.is_numeric_dtype(col):
+        return "num"
+    return "text"
+
+def write_dtab(df, path, dictionary_columns=('speaker',), row_group_size=65536, level=6):
+    '''
+    Write a frame to a .dtab file.
+
+    df: frame to write, e.g. a dialog table
+    path: where to write it
+    dictionary_columns: text columns to store dictionary encoded (few distinct values, e.g. speaker)
+    row_group_size: number of rows per row group
+    level: zlib compression level
+    '''
+
+    columns = []
+    dictionaries = {}
+    arrays = {}
+    for name in df.columns:
+        col = df[name]
+        if name in dictionary_columns:
+            codes, uniques = pd.factorize(col)
+            dictionaries[name] = [str(u) for u in uniques]
+            arrays[name] = codes.astype(np.int32)
+            columns.append({"name": name, "kind": "dict"})
+        elif _column_kind(col) == "num":
+            arrays[name] = col.to_numpy()
+            columns.append({"name": name, "kind": "num", "dtype": arrays[name].dtype.str})
+        else:
+            arrays[name] = col.to_numpy(dtype=object)
+            columns.append({"name": name, "kind": "text"})
+
+    groups = []
+    with open(path, 'wb') as fp:
+        fp.write(_MAGIC)
+        for start in range(0, len(df), row_group_size):
+            stop = min(start + row_group_size, len(df))
+            group = {"rows": stop - start, "chunks": {}, "values": {}}
+            for column in columns:
+                name = column["name"]
+                values = arrays[name][start:stop]
+                if column["kind"] == "dict":
+                    group["chunks"][name] = [_write_chunk(fp, values, level)]
+                    group["values"][name] = np.unique(values).tolist()
+                elif column["kind"] == "num":
+                    group["chunks"][name] = [_write_chunk(fp, values, level)]
+                else:
+                    missing = pd.isna(values)
+                    encoded = [str(v).encode('utf-8') if not m else b'' for v, m in zip(values, missing)]
+                    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+                    group["chunks"][name] = [_write_chunk(fp, np.frombuffer(b''.join(encoded), dtype=np.uint8), level),
+                                             _write_chunk(fp, offsets, level),
+                                             _write_chunk(fp, missing.astype(np.bool_), level)]
+            groups.append(group)
+
+        footer = json.dumps({"rows": len(df), "columns": columns, "dictionaries": dictionaries,
+                             "row_groups": groups}).encode('utf-8')
+        fp.write(footer)
+        fp.write(_LENGTH.pack(len(footer)))
+        fp.write(_MAGIC)
+
+def _read_footer(fp):
+    fp.seek(-(len(_MAGIC) + _LENGTH.size), 2)
+    length, = _LENGTH.unpack(fp.read(_LENGTH.size))
+    if fp.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError(f"{fp.name} is not a .dtab file")
+    fp.seek(-(len(_MAGIC) + _LENGTH.size + length), 2)
+    return json.loads(fp.read(length))
+
+def read_dtab(path, columns=None, speakers=None, speaker_column='speaker'):
+    '''
+    Read a .dtab file into a frame.
+
+    path: path to the file
+    columns: list of columns to read (default all); the others are never read from disk
+    speakers: only keep rows whose speaker_column is one of these. Row groups without any of them
+              are skipped without being read.
+    speaker_column: the dictionary encoded column speakers filters on
+    '''
+
+    with open(path, 'rb') as fp:
+        footer = _read_footer(fp)
+        kinds = {column["name"]: column for column in footer["columns"]}
+        names = list(kinds) if columns is None else list(columns)
+        for name in names:
+            if name not in kinds:
+                raise KeyError(f"No column {name} in {path}")
+
+        wanted = None
+        if speakers is not None:
+            dictionary = footer["dictionaries"][speaker_column]
+            speakers = set(speakers)
+            wanted = np.array([i for i, s in enumerate(dictionary) if s in speakers], dtype=np.int32)
+
+        parts = {name: [] for name in names}
+        for group in footer["row_groups"]:
+            mask = None
+            if wanted is not None:
+                if not np.isin(group["values"][speaker_column], wanted).any():
+                    continue
+                mask = np.isin(_read_chunk(fp, group["chunks"][speaker_column][0], np.int32), wanted)
+
+            for name in names:
+                column = kinds[name]
+                chunks = group["chunks"][name]
+                if column["kind"] == "dict":
+                    values = _read_chunk(fp, chunks[0], np.int32)
+                elif column["kind"] == "num":
+                    values = _read_chunk(fp, chunks[0], np.dtype(column["dtype"]))
+                else:
+                    blob = _read_chunk(fp, chunks[0], np.uint8).tobytes()
+                    offsets = _read_chunk(fp, chunks[1], np.int64)
+                    missing = _read_chunk(fp, chunks[2], np.bool_)
+                    keep = np.flatnonzero(mask) if mask is not None else range(len(missing))
+                    parts[name].append(np.array([np.nan if missing[i] else blob[offsets[i]:offsets[i+1]].decode('utf-8')
+                                                 for i in keep], dtype=object))
+                    continue
+                parts[name].append(values[mask] if mask is not None else values)
+
+    data = {}
+    for name in names:
+        column = kinds[name]
+        if column["kind"] == "dict":
+            codes = np.concatenate(parts[name]) if parts[name] else np.array([], dtype=np.int32)
+            dictionary = np.array(footer["dictionaries"][name] + [np.nan], dtype=object)
+            data[name] = dictionary[codes]
+        elif column["kind"] == "num":
+            data[name] = np.concatenate(parts[name]) if parts[name] else np.array([], dtype=np.dtype(column["dtype"]))
+        else:
+            data[name] = np.concatenate(parts[name]) if parts[name] else np.array([], dtype=object)
+    return pd.DataFrame(data, columns=names)
+
+
+def write_table(df, path):
+    # Write a frame as .dtab or as a tab-separated file, going by the extension
+    if path.endswith(DTAB_EXTENSION):
+        write_dtab(df, path)
+    else:
+        df.to_csv(path, sep='\t', index=False)
+
+def read_table(path, columns=None, speakers=None):
+    # Read a frame written by write_table, optionally only some columns and the rows of some speakers
+    if path.endswith(DTAB_EXTENSION):
+        return read_dtab(path, columns=columns, speakers=speakers)
+
+    usecols = None
+    if columns is not None:
+        usecols = list(columns) + (['speaker'] if speakers is not None and 'speaker' not in columns else [])
+    df = pd.read_csv(path, sep='\t', usecols=usecols)
+    if speakers is not None:
+        df = df[df['speaker'].isin(speakers)].reset_index(drop=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
@@ -1,6 +1,18 @@
 import unittest
 
 from .tests.utils import *
+from .tests.batch import *
+from .tests.cache import *
+from .tests.booknlp import *
+from .tests.jsonstream import *
+from .tests.ao3 import *
+from .tests.corpus import *
+from .tests.characters import *
+from .tests.network import *
+from .tests.render import *
+from .tests.sentiment import *
+from .tests.store import *
+from .tests.tables import *
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
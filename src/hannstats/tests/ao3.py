@@ -0,0 +1,142 @@
+import unittest
+import os
+import io
+import json
+import random
+import tempfile
+import numpy as np
+from unittest import mock
+
+from hannstats import ao3
+from hannstats.ao3 import iter_fics, clean_scrape, write_json_array, reservoir_sample, stratified_sample, stratum_fields
+from hannstats.utils import clean_AO3_text, clean_AO3_texts
+
+
+def _fic(rng):
+    return {"fandoms": [rng.choice(["Hannibal (TV)", "Hannibal (TV)", "Red Dragon"]), "Other"],
+            "additional_tags": rng.sample(["Fluff", "Fanart", "Podfic", "Angst"], rng.randint(0, 2)),
+            "words": rng.randint(1, 1000),
+            "chapters": [{"text": "<p>Some <b>text</b></p>"} for _ in range(rng.randint(1, 3))],
+            "rating": rng.choice(["Explicit", "Teen", "General"])}
+
+def _clean_in_memory(data):
+    # The procedure clean_hannibal used to run on the whole scrape at once
+    data = [story for story in data if story['fandoms'][0] == 'Hannibal (TV)']
+    data = [story for story in data if all(tag not in story['additional_tags'] for tag in ['Fanart', 'Podfic'])]
+    word_counts = np.array([story['words'] for story in data])
+    q_05 = np.quantile(word_counts, 0.05)
+    q_95 = np.quantile(word_counts, 0.95)
+    data = [story for story in data if q_05 < story['words'] and story['words'] < q_95]
+    for story in data:
+        for chapter in story['chapters']:
+            chapter['text'] = clean_AO3_text(chapter['text'])
+    return data
+
+
+class AO3TestCase(unittest.TestCase):
+
+    def test_clean_scrape(self):
+        # Same fics out whether the scrape is a JSON array or JSONL, and the same as cleaning in memory
+        rng = random.Random(11)
+        data = [_fic(rng) for _ in range(300)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, "scrape.json")
+            with open(json_path, 'w') as fp:
+                json.dump(data, fp)
+            jsonl_path = os.path.join(tmp, "scrape.jsonl")
+            with open(jsonl_path, 'w') as fp:
+                for fic in data:
+                    fp.write(json.dumps(fic) + '\n')
+
+            self.assertEqual(list(iter_fics(json_path)), data)
+            self.assertEqual(list(iter_fics(jsonl_path)), data)
+
+            expected = _clean_in_memory(json.loads(json.dumps(data)))
+            for path in [json_path, jsonl_path]:
+                out = io.StringIO()
+                write_json_array(clean_scrape(path, 'Hannibal (TV)', ['Fanart', 'Podfic']), out)
+                self.assertEqual(out.getvalue(), json.dumps(expected))
+
+            # Chapters cleaned across processes, a few fics at a time
+            out = io.StringIO()
+            write_json_array(clean_scrape(jsonl_path, 'Hannibal (TV)', ['Fanart', 'Podfic'], workers=2), out)
+            self.assertEqual(out.getvalue(), json.dumps(expected))
+
+    def test_clean_scrape_quantile_fields(self):
+        # The quantile pass reads only the fields the filters need; only the second pass decodes chapters
+        rng = random.Random(12)
+        data = [_fic(rng) for _ in range(50)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "scrape.json")
+            with open(path, 'w') as fp:
+                json.dump(data, fp)
+            with mock.patch.object(ao3, 'iter_fics', wraps=iter_fics) as spy:
+                list(clean_scrape(path, 'Hannibal (TV)', ['Fanart', 'Podfic']))
+            self.assertEqual([call.kwargs.get('fields') for call in spy.call_args_list],
+                             [['fandoms', 'additional_tags', 'words'], None])
+
+    def test_clean_AO3_texts(self):
+        # Tags go, entities are decoded after the tags are stripped, and order is kept across workers
+        texts = ["<p>Will&#8217;s <i>design</i></p>", "Fish &amp; chips", "&lt;b&gt; is a tag", "<br/>"] * 50
+        expected = ["Will\u2019s design", "Fish & chips", "<b> is a tag", ""] * 50
+        self.assertEqual(clean_AO3_texts(texts, workers=1), expected)
+        self.assertEqual(clean_AO3_texts(texts, workers=2, chunksize=7), expected)
+
+    def test_write_json_array_empty(self):
+        out = io.StringIO()
+        write_json_array(iter([]), out)
+        self.assertEqual(out.getvalue(), json.dumps([]))
+
+    def test_reservoir_sample(self):
+        # Right size, no repeats, reproducible with a seed, and roughly uniform
+        fics = [{"id": i} for i in range(100)]
+        sample = reservoir_sample(iter(fics), 10, seed=3)
+        self.assertEqual(len(sample), 10)
+        self.assertEqual(len({fic["id"] for fic in sample}), 10)
+        self.assertEqual(sample, reservoir_sample(iter(fics), 10, seed=3))
+        self.assertEqual(sorted(f["id"] for f in reservoir_sample(fics[:5], 10)), list(range(5)))
+
+        hits = [0] * 100
+        for seed in range(2000):
+            for fic in reservoir_sample(fics, 10, seed=seed):
+                hits[fic["id"]] += 1
+        self.assertTrue(all(100 < h < 300 for h in hits))
+
+    def test_stratified_sample(self):
+        # Strata get their proportional share, largest remainders first
+        fics = ([{"rating": "Explicit", "fandoms": ["A"]}] * 50 + [{"rating": "Teen", "fandoms": ["B"]}] * 30
+                + [{"rating": "General", "fandoms": ["B"]}] * 20)
+        rng = random.Random(0)
+        rng.shuffle(fics)
+
+        sample = stratified_sample(fics, 9, 'rating', seed=1)
+        ratings = [fic["rating"] for fic in sample]
+        self.assertEqual((ratings.count("Explicit"), ratings.count("Teen"), ratings.count("General")), (4, 3, 2))
+
+        sample = stratified_sample(fics, 10, 'fandom', seed=1)
+        self.assertEqual(sum(fic["fandoms"][0] == "A" for fic in sample), 5)
+        self.assertEqual(len(stratified_sample(fics, 500, 'rating')), 100)
+
+        # Fics without fandoms form their own stratum; a one-shot iterator can't be read twice
+        sample = stratified_sample(fics + [{"rating": "Teen", "fandoms": []}] * 10, 11, 'fandom', seed=1)
+        self.assertEqual(sum(not fic["fandoms"] for fic in sample), 1)
+        with self.assertRaises(ValueError):
+            stratified_sample(iter(fics), 10, 'rating')
+
+    def test_stratified_sample_from_file(self):
+        # Counting strata from a fields-only pass over a scrape gives the same sample, holding only quotas
+        rng = random.Random(13)
+        data = [_fic(rng) for _ in range(200)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "scrape.json")
+            with open(path, 'w') as fp:
+                json.dump(data, fp)
+
+            ratings = list(iter_fics(path, fields=stratum_fields('rating')))
+            self.assertEqual(ratings, [{"rating": fic["rating"]} for fic in data])
+
+            sample = stratified_sample(lambda: iter_fics(path), 20, 'rating', seed=4,
+                                       strata=iter_fics(path, fields=['rating']))
+            self.assertEqual(sample, stratified_sample(data, 20, 'rating', seed=4))
+            self.assertEqual(len(sample), 20)
@@ -0,0 +1,29 @@
+import unittest
+import os
+import tempfile
+import pandas as pd
+
+from hannstats.batch import ingest
+from hannstats.utils import screenplay_to_dialog_table
+
+class BatchTestCase(unittest.TestCase):
+
+    def test_ingest(self):
+        # Results should land in the matching output file whatever the worker count
+        snips = ['                           WILL GRAHAM\n                 Just the head?\n\n',
+                 '                           JACK CRAWFORD\n                 Minneapolis homicide.\n\n',
+                 '                           ABIGAIL\n                 Who is it?\n\n']
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f"{i}.txt") for i in range(len(snips))]
+            for path, snip in zip(paths, snips):
+                with open(path, 'w') as fp:
+                    fp.write(snip)
+
+            for workers in [1, 2]:
+                outpaths = [os.path.join(tmp, f"{i}_{workers}_dialog.tsv") for i in range(len(snips))]
+                result = ingest(screenplay_to_dialog_table, paths, outpaths, workers=workers, text_input=True)
+
+                self.assertEqual(result, outpaths)
+                speakers = [pd.read_csv(p, sep='\t')['speaker'][0] for p in outpaths]
+                self.assertEqual(speakers, ['WILL GRAHAM', 'JACK CRAWFORD', 'ABIGAIL'])
@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+import os
+import json
+import tempfile
+
+from hannstats.booknlp import iter_characters, iter_quotes, convert_tokens, TokenStore
+from hannstats.utils import load_bnlp_dialog, tokens_to_network
+
+_CHAR_BINS = os.path.join(os.path.dirname(__file__), "..", "..", "..", "character_bins.json")
+
+_BOOK = {"characters": [{"id": 0, "names": [{"n": "Will", "c": 3}], "agent": [{"w": "said", "i": 5}],
+                         "speaking": [{"w": "Hello, \"Doctor\".", "i": 30}, {"w": "Yes.", "i": 10}]},
+                        {"id": 1, "names": [], "speaking": [{"w": "Nobody.", "i": 1}]},
+                        {"id": 2, "names": [{"n": "Hannibal", "c": 9}],
+                         "speaking": [{"w": "Good evening.", "i": 20}, {"w": "Will.", "i": 1234567}]}],
+         "version": 12345678901}
+
+class BookNLPTestCase(unittest.TestCase):
+
+    def test_iter_characters(self):
+        # Tiny chunks force values to be split across reads
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.book")
+            with open(path, 'w') as fp:
+                json.dump(_BOOK, fp, indent=2)
+
+            for chunk_size in [1, 7, 1024]:
+                result = list(iter_characters(path, chunk_size))
+                expected = [(c['names'][0]['n'] if c['names'] else None, c['speaking']) for c in _BOOK['characters']]
+                self.assertEqual(result, expected)
+
+                quotes = [(name, list(indices), texts) for name, indices, texts in iter_quotes(path, chunk_size)]
+                self.assertEqual(quotes, [(name, [q['i'] for q in speaking], [q['w'] for q in speaking])
+                                          for name, speaking in expected])
+
+    def test_load_bnlp_dialog(self):
+        # Dialog is merged across characters by index, characters without names are dropped
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.book")
+            with open(path, 'w') as fp:
+                json.dump(_BOOK, fp)
+
+            df = load_bnlp_dialog(path)
+
+        expected = {"speaker": ["Will", "Hannibal", "Will", "Hannibal"],
+                    "dialog": ["Yes.", "Good evening.", "Hello, \"Doctor\".", "Will."],
+                    "index": [10, 20, 30, 1234567]}
+        self.assertEqual(df.to_dict('list'), expected)
+
+    def test_token_store(self):
+        # A store gives back the same columns and the same network as the .tokens file it came from,
+        # whether or not characterId holds only integers
+        with tempfile.TemporaryDirectory() as tmp:
+            book = os.path.join(tmp, "test.book")
+            with open(book, 'w') as fp:
+                json.dump(_BOOK, fp)
+
+            for ids in [["0", "-1", "2", "-1", "0", "2", "-1", "2"], ["0", "O", "2", "-1", "0", "O", "-1", "2"],
+                        ["O", "2", "-1", "0", "O", "2", "0", "-1"]]:
+                tokens = os.path.join(tmp, "test.tokens")
+                with open(tokens, 'w') as fp:
+                    fp.write("tokenId\tword\tcharacterId\n")
+                    for i, (word, cid) in enumerate(zip("the quick brown fox jumps over the dog".split(), ids)):
+                        fp.write(f"{i}\t{word}\t{cid}\n")
+
+                store_path = os.path.join(tmp, "test.tstore")
+                convert_tokens(tokens, book, store_path)
+                store = TokenStore(store_path)
+
+                self.assertEqual(len(store), 8)
+                self.assertEqual(store.column('word').tolist(), "the quick brown fox jumps over the dog".split())
+                self.assertEqual(store.column('tokenId').tolist(), list(range(8)))
+                self.assertEqual(store.character_names, ["Will", None, "Hannibal"])
+
+                expected = tokens_to_network(tokens, book, _CHAR_BINS, dist=3)
+                # The network is built from the stored codes, without decoding the column
+                with mock.patch.object(TokenStore, 'column', side_effect=AssertionError):
+                    result = tokens_to_network(store_path, None, _CHAR_BINS, dist=3)
+                self.assertEqual(result.to_dict('list'), expected.to_dict('list'))
+                self.assertGreater(len(result), 0)
@@ -0,0 +1,137 @@
+import unittest
+import os
+import sys
+import tempfile
+import importlib
+from unittest import mock
+
+from hannstats.cache import DiskCache
+from hannstats.utils import screenplay_to_dialog_table
+
+class CacheTestCase(unittest.TestCase):
+
+    def test_key_follows_file_content(self):
+        # Changing the contents of a file argument should change the key
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(os.path.join(tmp, 'cache'))
+            path = os.path.join(tmp, 'bins.json')
+            with open(path, 'w') as fp:
+                fp.write('{"Hannibal": ["hannibal"]}')
+            key1 = cache.key(screenplay_to_dialog_table, path, dist=15)
+            key2 = cache.key(screenplay_to_dialog_table, path, dist=15)
+            with open(path, 'w') as fp:
+                fp.write('{"Hannibal": ["lecter"]}')
+            key3 = cache.key(screenplay_to_dialog_table, path, dist=15)
+            key4 = cache.key(screenplay_to_dialog_table, path, dist=10)
+
+            self.assertEqual(key1, key2)
+            self.assertNotEqual(key1, key3)
+            self.assertNotEqual(key3, key4)
+
+    def test_call_and_evict(self):
+        # A second call is served from the cache, and old entries go once the cache is full
+        snip = '                           WILL GRAHAM\n                 Just the head?\n\n'
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(tmp)
+            first = cache.call(screenplay_to_dialog_table, snip)
+            key = cache.key(screenplay_to_dialog_table, snip)
+
+            self.assertTrue(first.equals(cache.get(key)))
+            self.assertTrue(first.equals(cache.call(screenplay_to_dialog_table, snip)))
+
+            cache.max_bytes = 0
+            cache.evict()
+            self.assertIsNone(cache.get(key))
+
+    def test_key_follows_code(self):
+        # Functions from modules with different source get different keys
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(os.path.join(tmp, 'cache'))
+            keys = []
+            for i, body in enumerate(["return 1", "return 2"]):
+                with open(os.path.join(tmp, f"parser{i}.py"), 'w') as fp:
+                    fp.write(f"def parse(x):\n    {body}\n")
+                sys.path.insert(0, tmp)
+                try:
+                    module = importlib.import_module(f"parser{i}")
+                finally:
+                    sys.path.remove(tmp)
+                parse = module.parse
+                parse.__module__, parse.__qualname__ = "parser", "parse"
+                sys.modules["parser"] = module
+                try:
+                    keys.append(cache.key(parse, "x"))
+                finally:
+                    del sys.modules["parser"], sys.modules[f"parser{i}"]
+            self.assertNotEqual(keys[0], keys[1])
+
+    def test_read_only_hit(self):
+        # A hit is still returned when its access time can't be updated
+        snip = '                           WILL GRAHAM\n                 Just the head?\n\n'
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(tmp)
+            first = cache.call(screenplay_to_dialog_table, snip)
+            with mock.patch("hannstats.cache.os.utime", side_effect=PermissionError):
+                self.assertTrue(first.equals(cache.get(cache.key(screenplay_to_dialog_table, snip))))
+
+    def test_key_by_stat(self):
+        # Keying on file listings never reads the files, and still follows changes to them
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(os.path.join(tmp, 'cache'), by_stat=True)
+            folder = os.path.join(tmp, 'networks')
+            os.makedirs(folder)
+            path = os.path.join(folder, 'ep1.tsv')
+            with open(path, 'w') as fp:
+                fp.write("source\ttarget\tweight\nWill\tHannibal\t3\n")
+
+            with mock.patch("hannstats.cache._dir_digest", side_effect=AssertionError):
+                key1 = cache.key(screenplay_to_dialog_table, folder)
+                self.assertEqual(key1, cache.key(screenplay_to_dialog_table, folder))
+                with open(path, 'a') as fp:
+                    fp.write("Will\tJack\t1\n")
+                self.assertNotEqual(key1, cache.key(screenplay_to_dialog_table, folder))
+
+    def test_dir_entries(self):
+        # Directory entries are found again, evicted by size like pickles, and a failed write leaves nothing
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(tmp)
+            key = cache.content_key(["artifacts", "1"], {"min_count": 5})
+            self.assertNotEqual(key, cache.content_key(["artifacts", "2"], {"min_count": 5}))
+            self.assertIsNone(cache.get_dir(key))
+
+            def write(path):
+                with open(os.path.join(path, "tokens.json"), 'w') as fp:
+                    fp.write("[]")
+            entry = cache.put_dir(key, write)
+            self.assertEqual(cache.get_dir(key), entry)
+            with open(os.path.join(entry, "tokens.json")) as fp:
+                self.assertEqual(fp.read(), "[]")
+
+            def fail(path):
+                write(path)
+                raise OSError("disk full")
+            with self.assertRaises(OSError):
+                cache.put_dir("other", fail)
+            self.assertEqual(sorted(os.listdir(tmp)), [key + ".d"])
+
+            cache.max_bytes = 0
+            cache.evict()
+            self.assertIsNone(cache.get_dir(key))
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_oversized_entry(self):
+        # An entry larger than the whole cache survives its own put (older entries make room) and
+        # is only dropped once something newer is written
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(tmp, max_bytes=1000)
+            cache.put("small", "x")
+            cache.put("big", "x" * 5000)
+            self.assertEqual(cache.get("big"), "x" * 5000)
+            self.assertIsNone(cache.get("small"))
+
+            def write(path):
+                with open(os.path.join(path, "corpus.mm"), 'w') as fp:
+                    fp.write("x" * 5000)
+            entry = cache.put_dir("artifacts", write)
+            self.assertTrue(os.path.isfile(os.path.join(entry, "corpus.mm")))
+            self.assertIsNone(cache.get("big"))
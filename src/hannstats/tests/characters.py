@@ -0,0 +1,64 @@
+import unittest
+import os
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+
+from hannstats.characters import CharacterResolver, AliasIndex, get_resolver
+
+_BINS = {"Will Graham": ["will graham", "will", "graham"], "Hannibal Lecter": ["hannibal", "dr. lecter"]}
+
+class CharactersTestCase(unittest.TestCase):
+
+    def test_resolve(self):
+        resolver = CharacterResolver(_BINS)
+        names = pd.Series(["WILL", "Dr. Lecter", "freddie LOUNDS", None, "will"], index=[5, 4, 3, 2, 1], name="speaker")
+
+        result = resolver.resolve(names, fallback='title')
+        self.assertEqual(result.index.tolist(), [5, 4, 3, 2, 1])
+        self.assertEqual(result.name, "speaker")
+        self.assertEqual(result.tolist()[:3] + result.tolist()[4:], ["Will Graham", "Hannibal Lecter", "Freddie Lounds", "Will Graham"])
+        self.assertTrue(pd.isna(result[2]))
+
+        self.assertEqual(resolver.resolve(["freddie LOUNDS", "graham"], fallback='keep').tolist(), ["freddie LOUNDS", "Will Graham"])
+        self.assertEqual(resolver.resolve(np.array(["freddie LOUNDS"]), fallback='lower').tolist(), ["freddie lounds"])
+
+    def test_fuzzy(self):
+        # Close variants are binned and reported, unrelated names fall back as usual
+        resolver = CharacterResolver(_BINS, fuzzy=0.75)
+        result = resolver.resolve(["Hannibal L.", "Dr Lecter", "Wil Graham", "Freddie", "WILL"], fallback='title')
+        self.assertEqual(result.tolist(), ["Hannibal Lecter", "Hannibal Lecter", "Will Graham", "Freddie", "Will Graham"])
+
+        report = resolver.report()
+        self.assertEqual(sorted(report["name"]), ["dr lecter", "hannibal l.", "wil graham"])
+        self.assertTrue((report["score"] >= 0.75).all())
+        self.assertEqual(report["score"].tolist(), sorted(report["score"], reverse=True))
+
+        # Without a threshold nothing is matched loosely
+        self.assertEqual(CharacterResolver(_BINS).resolve_one("Hannibal L.", 'keep'), "Hannibal L.")
+
+    def test_alias_index(self):
+        index = AliasIndex({"will": "Will Graham", "william": "William Blake"}, threshold=0.7)
+        self.assertEqual(index.match("William")[:2], ("William Blake", "william"))
+        self.assertEqual(index.match("Will")[0], "Will Graham")
+        self.assertIsNone(index.match("Jack"))
+        self.assertIsNone(index.match(""))
+
+    def test_get_resolver(self):
+        # One resolver per file, rebuilt when the file changes
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bins.json")
+            with open(path, 'w') as fp:
+                json.dump(_BINS, fp)
+
+            resolver = get_resolver(path)
+            self.assertIs(get_resolver(path), resolver)
+            self.assertIs(get_resolver(resolver), resolver)
+
+            with open(path, 'w') as fp:
+                json.dump({"Jack Crawford": ["jack"]}, fp)
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+
+            self.assertIsNot(get_resolver(path), resolver)
+            self.assertEqual(get_resolver(path).resolve_one("JACK"), "Jack Crawford")
@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+import os
+import tempfile
+
+from hannstats.corpus import write_pack, is_pack, texts_stamp, PackedCorpus
+from hannstats.utils import load_texts
+
+_TEXTS = [("101", "Will looked at the stag."), ("7", ""), ("33", "Hannibal’s kitchen — café \U0001F98C")]
+
+class CorpusTestCase(unittest.TestCase):
+
+    def test_pack(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "fics.pack")
+            write_pack(iter(_TEXTS), path)
+            self.assertTrue(is_pack(path))
+
+            pack = PackedCorpus(path)
+            self.assertEqual(len(pack), 3)
+            self.assertEqual(list(pack), _TEXTS)
+            self.assertEqual(pack["33"], _TEXTS[2][1])
+            self.assertEqual(bytes(pack.raw("101")), _TEXTS[0][1].encode('utf-8'))
+            self.assertNotIn("5", pack)
+
+            # Rewriting the texts in place, index untouched, changes the stamp
+            stamp = texts_stamp(path)
+            with open(os.path.join(path, "texts.bin"), 'r+b') as fp:
+                fp.write(b"X")
+            os.utime(os.path.join(path, "texts.bin"), ns=(0, 0))
+            self.assertNotEqual(texts_stamp(path), stamp)
+
+    def test_load_texts(self):
+        # Paths into a pack and plain files can be mixed, and a whole pack can be loaded at once
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "fics.pack")
+            write_pack(_TEXTS, path)
+            txt = os.path.join(tmp, "plain.txt")
+            with open(txt, 'w') as fp:
+                fp.write("plain")
+
+            texts = load_texts([os.path.join(path, "33"), txt, os.path.join(path, "101")])
+            self.assertEqual(texts, [_TEXTS[2][1], "plain", _TEXTS[0][1]])
+            self.assertEqual(load_texts(path), [text for _, text in _TEXTS])
+
+            empty = os.path.join(tmp, "empty.pack")
+            write_pack([], empty)
+            self.assertEqual(load_texts(empty), [])
+
+            # Each directory is checked for being a pack once, however many of its texts are loaded
+            with mock.patch("hannstats.corpus.is_pack", wraps=is_pack) as check:
+                texts = load_texts([os.path.join(path, "33"), txt, os.path.join(path, "101"), txt])
+            self.assertEqual(texts, [_TEXTS[2][1], "plain", _TEXTS[0][1], "plain"])
+            self.assertEqual(sorted(c.args[0] for c in check.call_args_list), sorted([path, tmp]))
@@ -0,0 +1,37 @@
+import unittest
+import io
+import json
+
+from hannstats.jsonstream import JSONStream
+
+_DOC = {"skip": {"a": [1, 2.5e-3, None, True, False, "x\\\"]}[{", {"b": "é中"}], "c": {}},
+        "keep": [{"s": "a \"quoted\" ] string", "n": -12345678901234}, [], {}, "", 0, 1.5, None],
+        "after": "end"}
+
+class JSONStreamTestCase(unittest.TestCase):
+
+    def test_walk(self):
+        # Skipping and decoding give the same values whatever the read size, with values split across reads
+        text = json.dumps(_DOC, indent=1)
+        for chunk_size in [1, 2, 5, 64, 1024]:
+            stream = JSONStream(io.StringIO(text), chunk_size)
+            seen = {}
+            for key in stream.keys():
+                if key == "skip":
+                    stream.skip()
+                elif key == "keep":
+                    seen[key] = list(stream.items())
+                else:
+                    seen[key] = stream.value()
+            self.assertEqual(seen, {"keep": _DOC["keep"], "after": "end"})
+            self.assertEqual(stream.peek(), '')
+
+    def test_find_key(self):
+        stream = JSONStream(io.StringIO(json.dumps(_DOC)), 3)
+        self.assertTrue(stream.find_key("after"))
+        self.assertEqual(stream.value(), "end")
+        self.assertFalse(JSONStream(io.StringIO(json.dumps(_DOC)), 3).find_key("missing"))
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            JSONStream(io.StringIO('{"a": [1, {"b": "c'), 4).find_key("z")
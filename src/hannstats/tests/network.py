@@ -0,0 +1,106 @@
+import unittest
+import os
+import random
+import tempfile
+import pandas as pd
+from collections import defaultdict, Counter
+
+from hannstats.network import EdgeAccumulator, TemporalNetwork, aggregate_networks
+
+
+def _dict_network(pairs):
+    # The networks used to be counted up like this
+    edges = defaultdict(Counter)
+    for source, target in pairs:
+        edges[source][target] += 1
+    return [(s, t, w) for s, edge in edges.items() for t, w in edge.items()]
+
+class NetworkTestCase(unittest.TestCase):
+
+    def test_add_pairs(self):
+        # Same edges and order as a dict of Counters, however the pairs are split up
+        rng = random.Random(17)
+        names = ["Will", "Hannibal", "Jack", "Alana", "Bev"]
+        pairs = [(rng.choice(names), rng.choice(names)) for _ in range(500)]
+        expected = _dict_network(pairs)
+
+        edges = EdgeAccumulator()
+        edges.add_pairs([s for s, _ in pairs], [t for _, t in pairs])
+        df = edges.to_frame()
+        self.assertEqual(list(zip(df['source'], df['target'], df['weight'])), expected)
+        self.assertEqual(set(df['type']), {"undirected"})
+
+        edges = EdgeAccumulator()
+        for start in range(0, 500, 37):
+            chunk = pairs[start:start+37]
+            edges.add_pairs([s for s, _ in chunk], [t for _, t in chunk])
+            edges.edges()
+        self.assertTrue(edges.to_frame().equals(df))
+
+    def test_merge(self):
+        # Merging keeps the first accumulator's edges first and adds up shared edges
+        first = EdgeAccumulator(["Will", "Jack"])
+        first.add_ids([0, 1, 0], [1, 0, 1], [2, 1, 3])
+        second = EdgeAccumulator()
+        second.add_pairs(["Alana", "Will"], ["Will", "Jack"], 4)
+
+        df = first.merge(second).to_frame()
+        self.assertEqual(list(zip(df['source'], df['target'], df['weight'])),
+                         [("Will", "Jack", 9), ("Jack", "Will", 1), ("Alana", "Will", 4)])
+        self.assertEqual(len(EdgeAccumulator().merge(EdgeAccumulator()).to_frame()), 0)
+
+    def test_aggregate_networks(self):
+        # Edges are summed across files, with both directions of an undirected edge counted together
+        frames = [pd.DataFrame({"source": ["Will", "Jack", "Will"], "target": ["Jack", "Will", "Alana"],
+                                "type": "undirected", "weight": [3, 4, 1]}),
+                  pd.DataFrame({"source": ["Alana", "Bev"], "target": ["Will", "Jack"],
+                                "type": "undirected", "weight": [10, 2]}),
+                  pd.DataFrame({"source": [], "target": [], "type": [], "weight": []})]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, df in enumerate(frames):
+                df.to_csv(os.path.join(tmp, f"ep{i}_network.tsv"), sep='\t', index=False)
+
+            df = aggregate_networks(tmp)
+            self.assertEqual(list(zip(df['source'], df['target'], df['weight'])),
+                             [("Jack", "Will", 7), ("Alana", "Will", 11), ("Bev", "Jack", 2)])
+
+            df = aggregate_networks(tmp, undirected=False, min_weight=3)
+            self.assertEqual(list(zip(df['source'], df['target'], df['weight'])),
+                             [("Will", "Jack", 3), ("Jack", "Will", 4), ("Alana", "Will", 10)])
+
+            df = aggregate_networks(tmp, top_k=2)
+            self.assertEqual(list(zip(df['source'], df['target'])), [("Jack", "Will"), ("Alana", "Will")])
+
+    def test_temporal_network(self):
+        # Snapshots match aggregating every step so far, and the long frame round-trips
+        rng = random.Random(20)
+        names = ["Will", "Hannibal", "Jack", "Alana", "Bev"]
+        steps = []
+        for _ in range(6):
+            pairs = [(rng.choice(names), rng.choice(names)) for _ in range(rng.randint(0, 8))]
+            steps.append(pd.DataFrame({"source": [s for s, _ in pairs], "target": [t for _, t in pairs],
+                                       "type": "undirected", "weight": [rng.randint(1, 5) for _ in pairs]}))
+
+        temporal = TemporalNetwork()
+        for i, df in enumerate(steps):
+            temporal.add_step(df, f"ep{i}")
+
+        def totals(df):
+            return {(s, t): w for s, t, w in zip(df['source'], df['target'], df['weight'])}
+
+        for k, (label, snapshot) in enumerate(temporal.snapshots()):
+            self.assertEqual(label, f"ep{k}")
+            expected = {}
+            for df in steps[:k+1]:
+                for edge, w in totals(df.groupby(['source', 'target'], as_index=False)['weight'].sum()).items():
+                    expected[edge] = expected.get(edge, 0) + w
+            self.assertEqual(totals(snapshot), expected)
+            self.assertTrue(snapshot.equals(temporal.snapshot(k)))
+
+        long = temporal.to_frame()
+        self.assertEqual(int(long['weight'].sum()), sum(int(df['weight'].sum()) for df in steps))
+        rebuilt = TemporalNetwork.from_frame(long)
+        self.assertEqual(totals(rebuilt.snapshot()), totals(temporal.snapshot()))
+        last = long.groupby(['source', 'target'])['cumulative'].last()
+        self.assertEqual({edge: w for edge, w in last.items()}, totals(temporal.snapshot()))
@@ -0,0 +1,56 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+from hannstats.render import disparity_filter, spring_layout, cached_layout, layout_path
+
+
+def _frame(edges):
+    return pd.DataFrame({"source": [s for s, _, _ in edges], "target": [t for _, t, _ in edges],
+                         "type": "undirected", "weight": [w for _, _, w in edges]})
+
+class RenderTestCase(unittest.TestCase):
+
+    def test_disparity_filter(self):
+        # A hub with one dominant tie among many light ones keeps the dominant tie only
+        edges = [("Will", "Hannibal", 100)] + [("Will", f"Extra {i}", 1) for i in range(20)] \
+                + [("Hannibal", f"Other {i}", 1) for i in range(20)]
+        df = disparity_filter(_frame(edges), alpha=0.05)
+        self.assertEqual(list(zip(df['source'], df['target'])), [("Will", "Hannibal")])
+
+        # Matches the formula edge by edge
+        rng = np.random.default_rng(0)
+        names = [f"n{i}" for i in range(8)]
+        edges = [(a, b, int(rng.integers(1, 50))) for i, a in enumerate(names) for b in names[i+1:] if rng.random() < 0.6]
+        strength = {n: sum(w for s, t, w in edges if n in (s, t)) for n in names}
+        degree = {n: sum(1 for s, t, _ in edges if n in (s, t)) for n in names}
+        def alpha(node, w):
+            return (1 - w / strength[node]) ** (degree[node] - 1) if degree[node] > 1 else 1.0
+        expected = [(s, t) for s, t, w in edges if min(alpha(s, w), alpha(t, w)) < 0.2]
+        df = disparity_filter(_frame(edges), alpha=0.2)
+        self.assertEqual(list(zip(df['source'], df['target'])), expected)
+
+    def test_layout(self):
+        # Layouts are reproducible, cover every node and are only computed once per network
+        df = _frame([("Will", "Hannibal", 5), ("Will", "Jack", 2), ("Alana", "Hannibal", 1)])
+        layout = spring_layout(df, seed=3)
+        self.assertEqual(sorted(layout['node']), ["Alana", "Hannibal", "Jack", "Will"])
+        self.assertTrue(layout.equals(spring_layout(df, seed=3)))
+        self.assertLessEqual(np.abs(layout[['x', 'y']].to_numpy()).max(), 1.0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "all_network.tsv")
+            df.to_csv(path, sep='\t', index=False)
+
+            first = cached_layout(path, seed=3)
+            self.assertTrue(os.path.isfile(layout_path(path)))
+            np.testing.assert_allclose(first[['x', 'y']].to_numpy(), layout[['x', 'y']].to_numpy())
+
+            mtime = os.stat(layout_path(path)).st_mtime_ns
+            cached_layout(path, seed=3)
+            self.assertEqual(os.stat(layout_path(path)).st_mtime_ns, mtime)
+
+            other = cached_layout(path, seed=4)
+            self.assertFalse(np.allclose(other[['x', 'y']].to_numpy(), first[['x', 'y']].to_numpy()))
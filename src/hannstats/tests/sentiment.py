@@ -0,0 +1,67 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from functools import partial
+
+from hannstats.sentiment import score_texts, add_sentiment, SentimentCache
+
+_CALLS = []
+
+def _length_score(text):
+    # Stand-in scorer; remembers what it was asked to score when run in this process
+    _CALLS.append(text)
+    return len(text) / 10
+
+def _scaled_score(text, scale):
+    return len(text) * scale
+
+class _Scorer:
+    def __call__(self, text):
+        return len(text)
+
+class SentimentTestCase(unittest.TestCase):
+
+    def test_score_texts(self):
+        # Distinct texts are scored once, scores line up with the input, and reruns come from the cache
+        texts = ["Hello.", "Goodbye.", "Hello.", np.nan, "Eat the rude."]
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, "sentiment.sqlite")
+
+            del _CALLS[:]
+            scores = score_texts(texts, scorer=_length_score, cache_path=cache_path, workers=1)
+            np.testing.assert_array_equal(scores, [0.6, 0.8, 0.6, np.nan, 1.3])
+            self.assertEqual(sorted(_CALLS), ["Eat the rude.", "Goodbye.", "Hello."])
+
+            del _CALLS[:]
+            df = add_sentiment(pd.DataFrame({"speaker": ["Will", "Jack"], "dialog": ["Goodbye.", "New line."]},
+                                            index=[7, 3]),
+                               scorer=_length_score, cache_path=cache_path, workers=1)
+            self.assertEqual(df['sentiment'].tolist(), [0.8, 0.9])
+            self.assertEqual(_CALLS, ["New line."])
+
+            # Across processes, with several batches
+            many = [f"line {i}" for i in range(50)]
+            scores = score_texts(many, scorer=_length_score, cache_path=None, workers=2, batch_size=7)
+            np.testing.assert_allclose(scores, [len(t) / 10 for t in many])
+
+    def test_partial_scorer(self):
+        # Partials and callable objects can be scorers, and partials with different arguments don't share scores
+        texts = ["Hello.", "Goodbye."]
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, "sentiment.sqlite")
+            for scale in [1, 2, 1]:
+                scores = score_texts(texts, scorer=partial(_scaled_score, scale=scale), cache_path=cache_path, workers=1)
+                np.testing.assert_array_equal(scores, [6 * scale, 8 * scale])
+            scores = score_texts(texts, scorer=_Scorer(), cache_path=cache_path, workers=1, scorer_name="length")
+            np.testing.assert_array_equal(scores, [6, 8])
+            scores = score_texts(texts, scorer=_Scorer(), cache_path=cache_path, workers=1)
+            np.testing.assert_array_equal(scores, [6, 8])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SentimentCache(os.path.join(tmp, "s.sqlite"))
+            cache.put_many([(str(i), i / 2) for i in range(1200)])
+            found = cache.get_many([str(i) for i in range(0, 1300, 100)])
+            self.assertEqual(found, {str(i): i / 2 for i in range(0, 1200, 100)})
@@ -0,0 +1,49 @@
+import unittest
+import random
+import pandas as pd
+
+from hannstats.store import CorpusStore
+
+
+class CorpusStoreTestCase(unittest.TestCase):
+
+    def test_select(self):
+        # Every slice matches scanning the original tables, rows in their original order
+        rng = random.Random(22)
+        speakers = ["Will Graham", "Hannibal", "Jack Crawford", "Alana Bloom"]
+        corpora = {name: [pd.DataFrame({"speaker": [rng.choice(speakers) for _ in range(n)],
+                                        "dialog": [f"{name} {i} line {j}" for j in range(n)]})
+                          for i, n in enumerate(rng.randint(0, 30) for _ in range(5))]
+                   for name in ["novels", "screenplays", "fanfic"]}
+
+        store = CorpusStore.from_frames(corpora)
+        self.assertEqual(len(store), sum(len(df) for items in corpora.values() for df in items))
+        self.assertEqual(sorted(store.corpora), ["fanfic", "novels", "screenplays"])
+
+        for name, items in corpora.items():
+            every = pd.concat(items, ignore_index=True)
+            self.assertEqual(store.select(name)['dialog'].sort_values().tolist(), every['dialog'].sort_values().tolist())
+            for speaker in speakers + ["Nobody"]:
+                expected = [d for df in items for d in df.loc[df['speaker'] == speaker, 'dialog']]
+                self.assertEqual(store.select(name, speaker)['dialog'].tolist(), expected)
+                for i, df in enumerate(items):
+                    expected = df.loc[df['speaker'] == speaker, 'dialog'].tolist()
+                    self.assertEqual(store.select(name, speaker, i)['dialog'].tolist(), expected)
+            for i, df in enumerate(items):
+                self.assertEqual(store.select(name, item_num=i)['dialog'].tolist(), df['dialog'].tolist())
+                self.assertEqual(store.item_size(name, i), len(df))
+
+            counts = every['speaker'].value_counts()
+            self.assertEqual(store.speaker_counts(name).to_dict(), counts.to_dict())
+            self.assertTrue(store.speaker_counts(name).is_monotonic_decreasing)
+            self.assertEqual(store.speaker_counts(name, normalize=True).to_dict(),
+                             every['speaker'].value_counts(normalize=True).to_dict())
+
+    def test_without_item_num(self):
+        # A table without item_num (e.g. topic assignments) is one item per corpus
+        df = pd.DataFrame({"corpus": ["novels", "fanfic", "novels"], "speaker": ["Will", "Will", "Hannibal"],
+                           "topic": [1, 2, 3]})
+        store = CorpusStore(df)
+        self.assertEqual(store.select("novels", "Will")['topic'].tolist(), [1])
+        self.assertEqual(store.select("novels", "Hannibal", 0)['topic'].tolist(), [3])
+        self.assertEqual(store.item_size("novels", 0), 2)
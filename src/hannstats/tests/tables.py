@@ -0,0 +1,76 @@
+import unittest
+import os
+import random
+import tempfile
+import numpy as np
+import pandas as pd
+
+from hannstats import tables
+
+
+class TablesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(23)
+        speakers = ["Will Graham", "Hannibal", "Jack Crawford", "Alana Bloom", "Bedelia"]
+        n = 500
+        self.df = pd.DataFrame({"index": np.arange(n) * 3,
+                                "speaker": [rng.choice(speakers) if rng.random() > 0.05 else np.nan for _ in range(n)],
+                                "dialog": [f"Line {i}, ça va? — {'x' * rng.randint(0, 20)}" if i % 17 else np.nan
+                                           for i in range(n)],
+                                "frame_number": np.full(n, 4, dtype=np.int64)})
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameFrame(self, a, b):
+        self.assertEqual(list(a.columns), list(b.columns))
+        self.assertEqual(a.astype(object).where(a.notna(), None).to_dict('list'),
+                         b.astype(object).where(b.notna(), None).to_dict('list'))
+
+    def test_round_trip(self):
+        path = os.path.join(self.tmp.name, "dialog.dtab")
+        tables.write_dtab(self.df, path, row_group_size=64)
+        df = tables.read_dtab(path)
+        self.assertSameFrame(df, self.df)
+        self.assertEqual(df['index'].dtype, np.int64)
+        self.assertEqual(df['frame_number'].dtype, np.int64)
+
+        # Empty tables keep their columns
+        tables.write_dtab(self.df.iloc[:0], path)
+        self.assertEqual(list(tables.read_dtab(path).columns), list(self.df.columns))
+        self.assertEqual(len(tables.read_dtab(path, speakers=["Hannibal"])), 0)
+
+    def test_projection_and_speakers(self):
+        path = os.path.join(self.tmp.name, "dialog.dtab")
+        tables.write_dtab(self.df, path, row_group_size=64)
+
+        df = tables.read_dtab(path, columns=["dialog", "index"])
+        self.assertSameFrame(df, self.df[["dialog", "index"]])
+
+        wanted = ["Hannibal", "Bedelia", "Nobody"]
+        expected = self.df[self.df['speaker'].isin(wanted)].reset_index(drop=True)
+        self.assertSameFrame(tables.read_dtab(path, speakers=wanted), expected)
+        self.assertSameFrame(tables.read_dtab(path, columns=["index"], speakers=wanted), expected[["index"]])
+
+        # Row groups without the speakers asked for are not read
+        df = self.df.copy()
+        df.loc[:255, 'speaker'] = "Will Graham"
+        df.loc[256:, 'speaker'] = "Hannibal"
+        tables.write_dtab(df, path, row_group_size=64)
+        self.assertEqual(tables.read_dtab(path, columns=["index"], speakers=["Hannibal"])['index'].tolist(),
+                         df['index'].iloc[256:].tolist())
+
+        with self.assertRaises(KeyError):
+            tables.read_dtab(path, columns=["sentiment"])
+
+    def test_read_table(self):
+        # .tsv and .dtab tables read back the same
+        frames = []
+        for ext in [".tsv", ".dtab"]:
+            path = os.path.join(self.tmp.name, "dialog" + ext)
+            tables.write_table(self.df, path)
+            frames.append(tables.read_table(path, columns=["index", "dialog"], speakers=["Will Graham"]))
+        self.assertSameFrame(frames[0], frames[1])
+        self.assertSameFrame(frames[1], self.df[self.df['speaker'] == "Will Graham"][["index", "dialog"]].reset_index(drop=True))
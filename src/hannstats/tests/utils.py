@@ -1,9 +1,37 @@
 
 import unittest
+import os
+import json
+import random
+import tempfile
+import numpy as np
+import pandas as pd
+from itertools import combinations
 
 from hannstats.utils import _get_candidates
 from hannstats.utils import _get_snippet
 from hannstats.utils import _clean_screenplay
+from hannstats.utils import _clean_screenplay_regex
+from hannstats.utils import _get_candidates_regex
+from hannstats.utils import screenplay_to_dialog_table
+from hannstats.utils import screenplay_to_scene_table
+from hannstats.utils import tokens_to_network
+from hannstats.utils import _window_edges
+from hannstats.utils import _window_edges_sweep
+from hannstats.utils import fandom_network
+from hannstats.utils import load_character_bins
+
+_CHAR_BINS = os.path.join(os.path.dirname(__file__), "..", "..", "..", "character_bins.json")
+
+def _window_network(names, dist):
+    # Reference sliding window count over a list of names, '-1' meaning no character
+    edges = {}
+    for i in range(len(names)-dist):
+        window = list(dict.fromkeys(names[i:i+dist]))
+        window = [n for n in window if n != '-1']
+        for pair in combinations(window, 2):
+            edges[pair] = edges.get(pair, 0) + 1
+    return edges
 
 class UtilsTestCase(unittest.TestCase):
 
@@ -87,3 +115,105 @@ class UtilsTestCase(unittest.TestCase):
         self.maxDiff = None
 
         self.assertEqual(result, expected)
+
+    def test_parser_matches_regex(self):
+        # The line parser should agree with the original regex implementation,
+        # including headers, CONT'D merging and lines of trailing spaces
+        sp = '\x0c      HANNIBAL - PROD. #101 - DBL GREEN Collated   6/26/13         43.\n\n                            JACK CRAWFORD\n                  What are you doing in here?\n       \n                            JACK CRAWFORD (CONT’D)\n                  Lets talk.\n                      (beat)\n                  Now.\n                  \n\n                            WILL GRAHAM\n                  Yes.\n                            HANNIBAL\n      x\n      Good.\n'
+
+        expected = _get_candidates_regex(_clean_screenplay_regex(sp))
+        result = screenplay_to_dialog_table(sp).to_dict('list')
+
+        self.assertEqual(_clean_screenplay(sp), _clean_screenplay_regex(sp))
+        self.assertEqual(_get_candidates(sp), _get_candidates_regex(sp))
+        self.assertEqual(result, expected)
+
+    def test_scene_table(self):
+        # Scene headings split the dialog, including scenes with no dialog
+        sp = 'TEASER\n\n1    INT. LAB - NIGHT    1\n\n                           WILL GRAHAM\n                 Just the head?\n\n                           JACK CRAWFORD\n                 Just the head.\n\n2    EXT. ROAD - DAY    2\n\n     Will drives.\n\n3    INT. OFFICE - DAY    3\n\n                           HANNIBAL\n                 Good evening.\n'
+        expected = {"speaker": ['WILL GRAHAM', 'JACK CRAWFORD', 'HANNIBAL'],
+                    "dialog": ["Just the head?", "Just the head.", "Good evening."],
+                    "scene_id": [1, 1, 3]}
+
+        df, offsets = screenplay_to_scene_table(sp)
+
+        self.assertEqual(df.to_dict('list'), expected)
+        self.assertEqual(list(offsets), [0, 0, 2, 2, 3])
+
+    def test_tokens_to_network(self):
+        # The event-based window count should match counting every window
+        rng = random.Random(4)
+        book = {"characters": [{"names": [{"n": n, "c": 1}]} for n in ["Will", "Graham", "Jack", "Clarice", "Reba"]]}
+        char_ids = [rng.choice(['-1', '-1', '-1', 'O', '0', '1', '2', '3', '4']) for _ in range(300)]
+        names = {'-1': '-1', '0': 'Will Graham', '1': 'Will Graham', '2': 'Jack Crawford', '3': 'Clarice Starling', '4': 'Reba McClane'}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            tokens_path = os.path.join(tmp, "test.tokens")
+            book_path = os.path.join(tmp, "test.book")
+            pd.DataFrame({"word": "w", "characterId": char_ids}).to_csv(tokens_path, sep='\t', index=False)
+            with open(book_path, 'w') as fp:
+                json.dump(book, fp)
+
+            for dist in [1, 5, 15]:
+                df = tokens_to_network(tokens_path, book_path, _CHAR_BINS, dist)
+                expected = _window_network([names[c] for c in char_ids if c != 'O'], dist)
+                result = {(s, t): w for s, t, w in zip(df['source'], df['target'], df['weight'])}
+                self.assertEqual(result, expected)
+
+            # Windows of less than a token hold nobody, as when every window was counted
+            for dist in [0, -3]:
+                self.assertEqual(len(tokens_to_network(tokens_path, book_path, _CHAR_BINS, dist)), 0)
+                self.assertEqual(len(tokens_to_network(tokens_path, book_path, _CHAR_BINS, dist, workers=2)), 0)
+
+            # Sharded over several processes
+            sharded = tokens_to_network(tokens_path, book_path, _CHAR_BINS, 5, workers=2)
+            self.assertTrue(sharded.equals(tokens_to_network(tokens_path, book_path, _CHAR_BINS, 5)))
+
+            # All sizes at once
+            sweep = tokens_to_network(tokens_path, book_path, _CHAR_BINS, [1, 5, 15])
+            for dist in [1, 5, 15]:
+                df = sweep[sweep['dist'] == dist].drop(columns='dist')
+                expected = tokens_to_network(tokens_path, book_path, _CHAR_BINS, dist)
+                self.assertEqual(df.to_dict('list'), expected.to_dict('list'))
+
+            # No sizes gives an empty table, sizes under one token empty networks
+            empty = tokens_to_network(tokens_path, book_path, _CHAR_BINS, [])
+            self.assertEqual((len(empty), list(empty.columns)), (0, list(sweep.columns)))
+            mixed = tokens_to_network(tokens_path, book_path, _CHAR_BINS, [0, 5, -1])
+            self.assertEqual(mixed.drop(columns='dist').to_dict('list'),
+                             tokens_to_network(tokens_path, book_path, _CHAR_BINS, 5).to_dict('list'))
+
+    def test_window_edges_large_cast(self):
+        # A cast far too large for an n by n matrix of counts, of which only a few ever meet
+        rng = random.Random(5)
+        n_names = 200000
+        names = np.array([f"c{i}" for i in range(n_names)], dtype=object)
+        cast = rng.sample(range(n_names), 40)
+        codes = np.array([rng.choice(cast) if rng.random() < 0.3 else -1 for _ in range(2000)], dtype=np.int64)
+
+        df = _window_edges(codes, names, 15).to_frame()
+        expected = _window_network([names[c] if c >= 0 else '-1' for c in codes], 15)
+        self.assertEqual({(s, t): w for s, t, w in zip(df['source'], df['target'], df['weight'])}, expected)
+
+        # And for several sizes at once
+        for dist, (source, target, weight) in zip([5, 15], _window_edges_sweep(codes, n_names, [5, 15])):
+            expected = _window_network([names[c] if c >= 0 else '-1' for c in codes], dist)
+            self.assertEqual(dict(zip(zip(names[source], names[target]), weight)), expected)
+
+    def test_fandom_network(self):
+        # Same counts as going over every pair of sorted characters in every fic
+        rng = random.Random(10)
+        tags = ["Will Graham", "will", "Hannibal Lecter", "Jack Crawford", "Abigail Hobbs", "Zed"]
+        fandom = [{"characters": [rng.choice(tags) for _ in range(rng.randint(0, 5))]} for _ in range(200)]
+        bins = load_character_bins(_CHAR_BINS)
+
+        expected = {}
+        for fic in fandom:
+            for a, b in combinations(sorted(fic["characters"]), 2):
+                a, b = bins.get(a.lower(), a), bins.get(b.lower(), b)
+                expected[(a, b)] = expected.get((a, b), 0) + 1
+
+        df = fandom_network(fandom, _CHAR_BINS)
+        result = {(s, t): w for s, t, w in zip(df['source'], df['target'], df['weight'])}
+        self.assertEqual(result, expected)
+        self.assertEqual(set(df['type']), {"undirected"})
@@ -1,11 +1,18 @@
 import regex
 import pandas as pd
 import numpy as np
+from scipy import sparse
 import json
-from itertools import combinations
-from collections import defaultdict
-from collections import Counter
+import os
+import html
 import string
+import bisect
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from hannstats import booknlp
+from hannstats import corpus
+from hannstats import characters
+from hannstats import network
 
 def _get_snippet(sp, start, end):
     # Given a screenplay and two line numbers,
@@ -14,15 +21,135 @@ def _get_snippet(sp, start, end):
     output = '\n'.join(lines[start-1:end-1])
     return output
 
+# Patterns for the line-based screenplay parser. Each one is matched against a
+# single line (without its newline), so they are compiled once here.
+_HEADER_LINE = regex.compile(r"[ ]*HANNIBAL (- PROD|Ep). #\d+")
+_STAGE_DIRECTION_LINE = regex.compile(r"[ ]+\([\w .!?,’]+\)")
+_SPEAKER_LINE = regex.compile(r"[ ]{10,}([A-Z][A-Z .]+(\(CONT’D\))?)")
+_CONTINUED = ' (CONT’D)'
+_SPEAKER_INDENT = ' ' * 10
+
+def _is_header(line):
+    return 'HANNIBAL' in line and _HEADER_LINE.match(line) is not None
+
+def _is_stage_direction(line):
+    return line[-1:] == ')' and _STAGE_DIRECTION_LINE.fullmatch(line) is not None
+
+# Everything in string.printable except the form feed survives cleaning. The
+# non-ascii characters are dropped by encoding, the rest by this table.
+_PRINTABLE = set(string.printable) - {'\x0c'}
+_UNPRINTABLE_ASCII = {i: None for i in range(128) if chr(i) not in _PRINTABLE}
+
+def _strip_unprintable(sp):
+    return sp.encode('ascii', 'ignore').decode('ascii').translate(_UNPRINTABLE_ASCII)
+
 def _clean_screenplay(sp):
     # Remove some garbage
+    lines = _strip_unprintable(sp).split('\n')
+    # Only lines followed by a newline count as page headers
+    lines = [line for line in lines[:-1] if not _is_header(line)] + lines[-1:]
+    return '\n'.join(lines)
+
+def _dialog_line_span(lines, i, stop):
+    # Number of lines (0, 1 or 2) taken up by a line of dialog starting at lines[i].
+    # Mirrors r'^[ ]{6,}.[^A-Z].+$\n', including the case where [^A-Z] eats the
+    # newline of a short line and the dialog carries on into the next one.
+    # lines[stop] is treated as the text after the final newline.
+    if i >= stop:
+        return 0
+    line = lines[i]
+    n = len(line)
+    s = n - len(line.lstrip(' '))
+    if s < 6:
+        return 0
+    k = min(s, n - 1)
+    if k == n - 1 and k >= 6:
+        if i + 1 < stop and lines[i+1]:
+            return 2
+        k -= 1
+    while k >= 6:
+        if k + 2 < n and not ('A' <= line[k+1] <= 'Z'):
+            return 1
+        k -= 1
+    return 0
+
+def _parse_lines(lines, start=0, stop=None):
+    # Single pass over the lines of a screenplay: find speaker lines, gather the
+    # dialog under them and merge (CONT'D) blocks into the block they continue.
+    # Only lines[start:stop] are read, lines[stop] acts as the end of the text
+    if stop is None:
+        stop = len(lines) - 1
+    speaker_merged = []
+    dialog_merged = []
+    parts = None
+    i = start
+    while i < stop:
+        line = lines[i]
+        m = _SPEAKER_LINE.fullmatch(line) if line.startswith(_SPEAKER_INDENT) else None
+        if m is None:
+            i += 1
+            continue
+        j = i + 1
+        span = _dialog_line_span(lines, j, stop)
+        if not span:
+            i += 1
+            continue
+        block = []
+        while span:
+            block.extend(lines[j:j+span])
+            j += span
+            span = _dialog_line_span(lines, j, stop)
+        block = [line.lstrip(' ') for line in block]
+        # A trailing line that was only spaces leaves no trailing space behind
+        if not block[-1]:
+            block.pop()
+        dialog = ' '.join(block)
+
+        speaker = m.group(1)
+        if parts is not None and speaker == speaker_merged[-1] + _CONTINUED:
+            parts.append(dialog)
+        else:
+            if parts is not None:
+                dialog_merged.append(' '.join(parts))
+            speaker_merged.append(speaker)
+            parts = [dialog]
+        i = j
+
+    if parts is not None:
+        dialog_merged.append(' '.join(parts))
+
+    return speaker_merged, dialog_merged
+
+def _get_candidates(screenplay):
+    # Drop interjected stage directions, then find chunks of text that look like dialog
+    lines = screenplay.split('\n')
+    lines = [line for line in lines[:-1] if not _is_stage_direction(line)] + lines[-1:]
+    speaker, dialog = _parse_lines(lines)
+
+    #Format as dict
+    data = {"speaker": speaker, "dialog": dialog}
+    return data
+
+def _screenplay_lines(screenplay):
+    # Clean a screenplay and split it into lines, dropping page headers and
+    # interjected stage directions along the way
+    lines = _strip_unprintable(screenplay).split('\n')
+    lines = [line for line in lines[:-1]
+             if not (_is_header(line) or _is_stage_direction(line))] + lines[-1:]
+    return lines
+
+def _clean_screenplay_regex(sp):
+    # Original regex implementation of _clean_screenplay, kept as a reference for
+    # scripts/benchmark_parser.py
     printable = set(string.printable)
     printable.remove(u'\x0c')
     sp = ''.join(filter(lambda x: x in printable, sp))
     sp = regex.sub(r"^[ ]*HANNIBAL (- PROD|Ep). #\d+.*$\n", "", sp, flags=regex.MULTILINE)
     return sp
 
-def _get_candidates(screenplay):
+def _get_candidates_regex(screenplay):
+    # Original regex implementation of _get_candidates, kept as a reference for
+    # scripts/benchmark_parser.py
     # First, remove interjected stage directions
     screenplay = regex.sub(r'^[ ]+\([\w .!?,’]+\)$\n', "", screenplay, flags=regex.MULTILINE)
 
@@ -69,25 +196,51 @@ def screenplay_to_dialog_table(screenplay):
     screenplay: string; works best on direct pdf-to-text output
     '''
     
-    screenplay = _clean_screenplay(screenplay)
-    data = _get_candidates(screenplay)
+    lines = _screenplay_lines(screenplay)
+    speaker, dialog = _parse_lines(lines)
 
-    df = pd.DataFrame(data)
+    df = pd.DataFrame({"speaker": speaker, "dialog": dialog})
 
     return df
 
-def _get_character_dialog(character):
-    # Given a dict from the 'characters' list of a booknlp .book file, return all dialog as list of tuples of form
-    # (character_name, line_of_dialog, index_of_line)
+def screenplay_to_scene_table(screenplay):
+    '''
+    Take a Hannibal script as a string input and extract all dialogue instances along with the scene
+    they belong to, in a single pass over the script. Returns the dialog table, with an extra scene_id
+    column, and an array of scene offsets: the rows of scene i are offsets[i]:offsets[i+1].
 
-    name = character['names'][0]['n']
-    dialog = []
-    for line in character['speaking']:
-        dialog.append((name, line['w'], line['i']))
+    Scenes are split on numbered scene headings if the script has any, otherwise on INT./EXT. sluglines.
+    Text before the first heading is scene 0.
 
-    return dialog
+    screenplay: string; works best on direct pdf-to-text output
+    '''
+
+    lines = _screenplay_lines(screenplay)
+
+    for marker in _SCENE_MARKERS:
+        starts = [i for i, line in enumerate(lines) if marker.fullmatch(line)]
+        if starts:
+            break
+    else:
+        raise ValueError("No scene headings found in screenplay")
+
+    # Each heading ends the scene before it and starts the next one
+    bounds = zip([-1] + starts, starts + [len(lines) - 1])
+    speakers = []
+    dialogs = []
+    offsets = [0]
+    for head, stop in bounds:
+        speaker, dialog = _parse_lines(lines, head + 1, stop)
+        speakers.extend(speaker)
+        dialogs.extend(dialog)
+        offsets.append(len(speakers))
+
+    offsets = np.array(offsets)
+    scene_id = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    df = pd.DataFrame({"speaker": speakers, "dialog": dialogs, "scene_id": scene_id})
+
+    return df, offsets
 
-    
 def load_bnlp_dialog(book_path):
     '''
     Given the path to a .book file produced by booknlp, return a pandas dataframe with
@@ -96,29 +249,60 @@ def load_bnlp_dialog(book_path):
     book_path: path to the .book file
     '''
 
-    with open(book_path) as fp:
-        book = json.load(fp)
-
-    characters = book['characters']
+    # Read the characters one at a time, keeping only the index, speaker and text of each line as flat arrays
+    names, codes, indices, lines = [], [], [], []
+    for name, index, text in booknlp.iter_quotes(book_path):
+        if name is None:
+            continue
+        codes.append(np.full(len(index), len(names), dtype=np.int64))
+        names.append(name)
+        indices.append(index)
+        lines.extend(text)
 
-    # Get one big list of all dialog
-    all_dialog = [dialog for dialog_list in [_get_character_dialog(char) for char in characters if len(char['names']) > 0] for dialog in dialog_list]
+    codes = np.concatenate(codes) if codes else np.array([], dtype=np.int64)
+    indices = np.concatenate(indices) if indices else np.array([], dtype=np.int64)
 
-    # Sort all_dialog by index
-    all_dialog = sorted(all_dialog, key=(lambda x: x[2]))
+    # Sort all dialog by index (ties keep character order, then the order within a character)
+    order = np.argsort(indices, kind='stable')
 
     # Make it a dataframe
-    df = pd.DataFrame(all_dialog, columns=["speaker", "dialog", "index"])
+    df = pd.DataFrame({"speaker": np.array(names, dtype=object)[codes[order]],
+                       "dialog": np.array(lines, dtype=object)[order],
+                       "index": indices[order]})
 
     return df
 
+_HTML_TAG = regex.compile(r"<[^>]*>")
+
 def clean_AO3_text(text):
-    # Given text from an AO3 story, clean up unwanted HTML content
+    # Given text from an AO3 story, clean up unwanted HTML content and decode entities (&amp;, &#8217; etc.).
+    # Tags are stripped before entities are decoded, so an escaped "&lt;b&gt;" stays in the text as "<b>".
 
-    expr = regex.compile(r"<[^>]*>")
-    cleaned = regex.sub(expr, "", text)
+    cleaned = _HTML_TAG.sub("", text)
 
-    return cleaned
+    return html.unescape(cleaned)
+
+def clean_AO3_texts(texts, workers=None, chunksize=64, pool=None):
+    '''
+    Clean many AO3 texts at once with clean_AO3_text, across a pool of worker processes. Returns the
+    cleaned texts as a list, in input order.
+
+    texts: iterable of texts, e.g. the chapters of a scrape
+    workers: number of worker processes; None uses every core, 1 runs in this process
+    chunksize: number of texts sent to a worker at a time
+    pool: an existing ProcessPoolExecutor to use instead of starting one (workers is then ignored)
+    '''
+
+    if pool is not None:
+        return list(pool.map(clean_AO3_text, texts, chunksize=chunksize))
+
+    if workers is None:
+        workers = os.cpu_count()
+    if workers == 1:
+        return [clean_AO3_text(text) for text in texts]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(clean_AO3_text, texts, chunksize=chunksize))
 
 def flip_mapping(mapping):
     # given a mapping of string to list of string, return an inverse mapping. Assumes that lists are mutually exclusive
@@ -126,60 +310,315 @@ def flip_mapping(mapping):
     return {e: k for k, v in mapping.items() for e in v}
 
 def load_texts(filepaths):
+    # Read the text at each path. A path can also point into a pack (corpus.write_pack) as <pack>/<id>,
+    # and a pack on its own can be given instead of a list of paths to load all of its texts.
+    if isinstance(filepaths, str) and corpus.is_pack(filepaths):
+        return [text for _, text in corpus.PackedCorpus(filepaths)]
+
+    # Whether a directory is a pack is only checked once per directory, so texts in a pack cost no
+    # file system calls and plain files one open each
+    packs = {}
+    not_packs = set()
     texts = []
     for path in filepaths:
+        pack_path, text_id = os.path.split(path)
+        if pack_path not in packs and pack_path not in not_packs:
+            if corpus.is_pack(pack_path):
+                packs[pack_path] = corpus.PackedCorpus(pack_path)
+            else:
+                not_packs.add(pack_path)
+        if pack_path in packs:
+            texts.append(packs[pack_path][text_id])
+            continue
+
         with open(path) as fp:
             text = fp.read()
             texts.append(text)
 
     return texts
 
-def tokens_to_network(tokens_path, book_path,  character_bins, dist=15):
+def _resolve_ids(uniques, book_names, resolver):
+    # Integer codes for the binned character names of distinct booknlp character ids, numbered in
+    # order of first appearance. Ids of -1 (no character) get the code -1. Returns the code of each
+    # id and the names the codes stand for.
+    names = [book_names[int(x)].lower() if int(x) != -1 else '-1' for x in uniques]
+    names = resolver.resolve(names, fallback='title')
+    name_codes, names = pd.factorize(pd.Series(names, dtype=object))
+    # The '-1' placeholder never counts as a character
+    name_codes = np.where(np.array(names, dtype=object)[name_codes] == '-1', -1, name_codes)
+    return name_codes, np.array(names, dtype=object)
+
+def _name_codes(char_ids, book_names, resolver):
+    # Turn a series of booknlp character ids into integer codes for the binned character names.
+    # Returns the codes and the names they stand for.
+    ids, uniques = pd.factorize(char_ids)
+    name_codes, names = _resolve_ids(uniques, book_names, resolver)
+    return name_codes[ids], names
+
+def _store_name_codes(store, resolver):
+    # _name_codes for the characterId column of a token store, working on the memory-mapped column
+    # as it is stored rather than decoding it: integer ids are factorized directly, and for a text
+    # column the dictionary is resolved once and the codes are looked up through it. Tokens with
+    # the id 'O' are dropped, as in tokens_to_network.
+    raw = store.codes('characterId')
+    if store.columns['characterId'] == 'int':
+        return _name_codes(np.asarray(raw), store.character_names, resolver)
+
+    strings = store.strings('characterId')
+    ids = [i for i, s in enumerate(strings) if s != 'O']
+    if len(ids) < len(strings):
+        raw = raw[raw != strings.index('O')]
+    # One slot per dictionary entry plus a trailing -1, which missing values (code -1) index
+    lookup = np.full(len(strings) + 1, -1, dtype=np.int64)
+    lookup[ids], names = _resolve_ids([strings[i] for i in ids], store.character_names, resolver)
+    return lookup[raw], names
+
+# Number of counted pairs to collect before adding them up, which bounds the memory held by pairs
+# counted again and again to roughly this many entries on top of one entry per distinct pair
+_PAIR_BATCH = 1 << 20
+
+def _count_windows(codes, names, dist):
+    # Count, for every window codes[i:i+dist] with i in range(len(codes)-dist), each pair of distinct
+    # characters in the window, ordered by where they first appear in it. Returns an EdgeAccumulator
+    # of the pair counts, with pairs added in the order they were first counted.
+    #
+    # The set of characters in the window (and their order) only changes when a mention enters or
+    # leaves it, so rather than looking at every window we keep running counts of the characters in
+    # the window and only do work when a mention crosses one of its edges. Co-occurring pairs are few
+    # next to all pairs of names, so counts are kept per pair seen rather than in an n by n matrix.
+    edges = network.EdgeAccumulator(names)
+    n_windows = len(codes) - dist
+    positions = np.flatnonzero(codes >= 0)
+    # Windows of fewer than one token hold no pairs, so dist < 1 gives an empty network
+    if dist < 1 or n_windows <= 0 or len(positions) == 0:
+        return edges
+
+    mentions = codes[positions]
+
+    # Position of the next mention of the same character, for when a mention leaves the window
+    order = np.lexsort((positions, mentions))
+    next_same = np.full(len(positions), -1, dtype=np.int64)
+    same = mentions[order[1:]] == mentions[order[:-1]]
+    next_same[order[:-1][same]] = positions[order[1:][same]]
+    next_same = dict(zip(positions.tolist(), next_same.tolist()))
+
+    # Mention p is in windows p-dist+1 through p
+    enters = np.maximum(positions - dist + 1, 0)
+    leaves = positions + 1
+    events = np.unique(np.concatenate([enters, leaves]))
+    events = events[events < n_windows].tolist() + [n_windows]
+
+    counts = [0] * len(names)
+    firsts = []     # (first position in the window, character), sorted
+    n_in, n_out = 0, 0
+    positions = positions.tolist()
+    mentions = mentions.tolist()
+    enters = enters.tolist()
+    triu = {}
+    pending = []    # (source, target, weight) counted since the last batch was added up
+    n_pending = 0
+
+    for i, stop in zip(events[:-1], events[1:]):
+        while n_out < len(positions) and positions[n_out] + 1 <= i:
+            p, c = positions[n_out], mentions[n_out]
+            counts[c] -= 1
+            firsts.pop(0)
+            if counts[c] > 0:
+                bisect.insort(firsts, (next_same[p], c))
+            n_out += 1
+        while n_in < len(positions) and enters[n_in] <= i:
+            c = mentions[n_in]
+            if counts[c] == 0:
+                firsts.append((positions[n_in], c))
+            counts[c] += 1
+            n_in += 1
+
+        k = len(firsts)
+        if k < 2:
+            continue
+        if k not in triu:
+            triu[k] = np.triu_indices(k, 1)
+        chars = np.array([c for _, c in firsts])
+        source = chars[triu[k][0]]
+        pending.append((source, chars[triu[k][1]], np.full(len(source), stop - i, dtype=np.int64)))
+        n_pending += len(source)
+
+        if n_pending >= _PAIR_BATCH:
+            # Adding up keeps each pair where it was first counted, so the order is unchanged
+            edges.add_ids(*[np.concatenate(x) for x in zip(*pending)])
+            edges.edges()
+            pending, n_pending = [], 0
+
+    if pending:
+        edges.add_ids(*[np.concatenate(x) for x in zip(*pending)])
+    return edges
+
+def _window_edges(codes, names, dist, workers=1):
+    # EdgeAccumulator with the window co-occurrence network.
+    #
+    # With more than one worker the window starts are split into shards, each handed the tokens for
+    # its windows (so shards overlap by dist tokens) and counted in its own process. Each shard counts
+    # a disjoint set of windows, so merging the shards in order adds up the counts and keeps pairs
+    # first seen in an earlier shard in their place.
+    n_windows = len(codes) - dist
+    if workers == 1 or n_windows <= workers or dist < 1:
+        return _count_windows(codes, names, dist)
+
+    bounds = np.linspace(0, n_windows, 4 * workers + 1).astype(np.int64)
+    shards = [codes[start:stop+dist] for start, stop in zip(bounds[:-1], bounds[1:])]
+    edges = network.EdgeAccumulator(names)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for shard in pool.map(_count_windows, shards, repeat(names), repeat(dist)):
+            edges.merge(shard)
+    return edges
+
+def _sum_pairs(summed, pending):
+    # Add up the counts of pairs counted more than once, keeping for each pair (in order of its first
+    # count) the first window and first appearances it was first counted with. summed is an earlier
+    # result (or None) and pending a list of newer counts, in the order they were made.
+    chunks = ([summed] if summed is not None else []) + pending
+    if not chunks:
+        return (np.array([], dtype=np.int64),) * 5
+    key, weight, *firsts = [np.concatenate(x) for x in zip(*chunks)]
+    keys, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    sums = np.zeros(len(keys), dtype=np.int64)
+    np.add.at(sums, inverse, weight)
+    order = np.argsort(first)
+    return (keys[order], sums[order]) + tuple(x[first[order]] for x in firsts)
+
+def _window_edges_sweep(codes, n_names, dists):
+    # Same counts as _window_edges, for several window sizes in one scan over the mentions.
+    # Returns a list with (source, target, weight) arrays for each entry of dists, in the order the
+    # pairs were first counted.
+    #
+    # For window starts i between two consecutive mentions, the first appearance f of each character
+    # at or after i is the same. A pair (a, b) with f_a < f_b is counted in window i for size d when
+    # f_b <= i+d-1 and i < len(codes)-d, so each run of window starts adds a closed-form count to
+    # every pair for every d, which depends only on f_b. As in _count_windows, counts are kept per
+    # (size, pair) seen, keyed by (d * n_names + a) * n_names + b, rather than in dense matrices.
+    dists = np.asarray(dists, dtype=np.int64)
+    # Sizes under one token get empty networks, as in _count_windows
+    valid = dists >= 1
+    if not valid.all():
+        edges = iter(_window_edges_sweep(codes, n_names, dists[valid]))
+        return [next(edges) if ok else (np.array([], dtype=np.int64),) * 3 for ok in valid]
+    if len(dists) == 0:
+        return []
+
+    n_tokens = len(codes)
+    positions = np.flatnonzero(codes >= 0)
+    mentions = codes[positions]
+    if len(positions) == 0:
+        return [(np.array([], dtype=np.int64),) * 3 for _ in dists]
+
+    order = np.lexsort((positions, mentions))
+    next_same = np.full(len(positions), -1, dtype=np.int64)
+    same = mentions[order[1:]] == mentions[order[:-1]]
+    next_same[order[:-1][same]] = positions[order[1:][same]]
+
+    # Each character's first mention, sorted
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ~same
+    firsts = sorted(zip(positions[order[first]].tolist(), mentions[order[first]].tolist()))
+
+    reach = int(dists.max()) - 1
+    last_window = n_tokens - dists - 1
+    positions = positions.tolist()
+    mentions = mentions.tolist()
+    next_same = next_same.tolist()
+    triu = {}
+    n = max(n_names, 1)
+    summed = None   # (key, weight, first window, f_source, f_target) of each pair counted so far
+    pending = []    # the same, one entry per count since the last batch was added up
+    n_pending = 0
+    lo = 0
+
+    for t, hi in enumerate(positions):
+        # Window starts lo..hi all see the same first appearances
+        m = bisect.bisect_right(firsts, (hi + reach, n_names))
+        if m >= 2:
+            f = np.array([x for x, _ in firsts[:m]])
+            chars = np.array([c for _, c in firsts[:m]])
+
+            # First window start in lo..hi at which each character is inside the window, per size
+            start = np.maximum(lo, f[None, :] - dists[:, None] + 1)
+            stop = np.minimum(hi, last_window)[:, None]
+            counts = np.maximum(stop - start + 1, 0)
+
+            if m not in triu:
+                triu[m] = np.triu_indices(m, 1)
+            j, k = triu[m]
+            source, target = chars[j], chars[k]
+
+            pair_counts = counts[:, k]
+            d_idx, pair_idx = np.nonzero(pair_counts > 0)
+            if len(d_idx) > 0:
+                pending.append(((d_idx * n + source[pair_idx]) * n + target[pair_idx], pair_counts[d_idx, pair_idx],
+                                start[d_idx, k[pair_idx]], f[j[pair_idx]], f[k[pair_idx]]))
+                n_pending += len(d_idx)
+            if n_pending >= _PAIR_BATCH:
+                summed = _sum_pairs(summed, pending)
+                pending, n_pending = [], 0
+
+        # Move past this mention; its character next shows up at its next mention
+        firsts.pop(0)
+        if next_same[t] >= 0:
+            bisect.insort(firsts, (next_same[t], mentions[t]))
+        lo = hi + 1
+
+    key, weight, start, f_source, f_target = _sum_pairs(summed, pending)
+    d_idx, pair = np.divmod(key, n * n)
+    source, target = np.divmod(pair, n)
+
+    edges = []
+    for d in range(len(dists)):
+        keep = np.flatnonzero(d_idx == d)
+        # Order pairs by the first window they were counted in, then as combinations() would
+        keep = keep[np.lexsort((f_target[keep], f_source[keep], start[keep]))]
+        edges.append((source[keep], target[keep], weight[keep]))
+
+    return edges
+
+def tokens_to_network(tokens_path, book_path,  character_bins, dist=15, workers=1):
     # Given the path to a .tokens and corresponding .book file produced by booknlp, return a dataframe with the social network for that graph
-    # dist: upper limit for number of words between two characters to constitute a mention
-
-    tok = pd.read_csv(tokens_path, sep='\t')
-    with open(book_path) as fp:
-        book = json.load(fp)['characters']
-    char_ids = tok['characterId']
-    char_ids = char_ids[~(char_ids == 'O')]
-    char_ids = char_ids.map(lambda x: book[int(x)]['names'][0]['n'].lower() if x != '-1' else x)
-    cbins = load_character_bins(character_bins)
-    char_ids = char_ids.map(lambda x: cbins[x] if x in cbins else x.title())
-
-    edges = defaultdict(Counter)
-
-
-    # Slide a window over the character Ids
-    for i in range(len(char_ids)-dist):
-        window = char_ids[i:i+dist]
-
-        characters = window.unique()
-        characters = characters[characters != '-1']
-        pairs = combinations(characters, 2)
-        for pair in pairs:
-            # Get character names
-            name1 = pair[0]
-            name2 = pair[1]
-            # increase edge weight between the two characters by 1
-            edges[name1][name2] += 1
-
-    # Now just make the edges dict into a dataframe
-    data = {"source": [], "target": [], "type": [], "weight": []}
-
-    for char, edge in edges.items():
-        for char2, weight in edge.items():
-            data["source"].append(char)
-            data["target"].append(char2)
-            data["type"].append("undirected")
-            data["weight"].append(weight)
-
-    df = pd.DataFrame(data)
+    # tokens_path: path to the .tokens file, or to a token store written by booknlp.convert_tokens, in which case the
+    #       columns are memory-mapped instead of parsed and book_path is not used
+    # dist: upper limit for number of words between two characters to constitute a mention. Given a list of
+    #       window sizes, the networks for all of them are computed in one pass and returned as one table with a dist column
+    # workers: number of processes to split the token stream across, for a single dist
+
+    resolver = characters.get_resolver(character_bins)
+    if os.path.isdir(tokens_path):
+        codes, names = _store_name_codes(booknlp.TokenStore(tokens_path), resolver)
+    else:
+        tok = booknlp.read_tokens(tokens_path)
+        char_ids = tok['characterId']
+        char_ids = char_ids[~(char_ids == 'O')]
+        codes, names = _name_codes(char_ids, booknlp.load_character_names(book_path), resolver)
+
+    if np.ndim(dist) == 0:
+        df = _window_edges(codes, names, dist, workers).to_frame()
+        return df
+
+    # Several window sizes: one long edge table with a dist column
+    if workers != 1:
+        raise ValueError("workers can only be used with a single dist")
+    frames = []
+    for d, (source, target, weight) in zip(dist, _window_edges_sweep(codes, len(names), dist)):
+        edges = network.EdgeAccumulator(names)
+        edges.add_ids(source, target, weight)
+        frames.append(edges.to_frame().assign(dist=d))
+    if not frames:
+        frames.append(network.EdgeAccumulator(names).to_frame().assign(dist=np.array([], dtype=np.int64)))
+    df = pd.concat(frames, ignore_index=True)
     return df
 
+# Scene headings: numbered ("12 INT. HOUSE - NIGHT 12") or bare sluglines
+_SCENE_MARKERS = [regex.compile(r"^([AB]?\d+)[ ]*[A-Z .\-’,]+\1$", flags=regex.MULTILINE),
+                  regex.compile(r"^[ ]*(?:INT.|EXT.)[A-Z .\-’,]+$", flags=regex.MULTILINE)]
+
 def _get_scenes(script):
-    scenemarker_1 = regex.compile(r"^([AB]?\d+)[ ]*[A-Z .\-’,]+\1$", flags=regex.MULTILINE)
-    scenemarker_2 = regex.compile(r"^[ ]*(?:INT.|EXT.)[A-Z .\-’,]+$", flags=regex.MULTILINE)
+    scenemarker_1, scenemarker_2 = _SCENE_MARKERS
     if regex.search(scenemarker_1, script):
         scenes = regex.split(scenemarker_1, script)[0::2]
         #print("regex 1")
@@ -196,66 +635,72 @@ def load_character_bins(cbin_path):
     cbins = flip_mapping(cbins)
     return cbins
 
+def bin_dialog_speakers(df, character_bins):
+    # Lowercase the speakers of a dialog table and replace known aliases with their character bin
+    resolver = characters.get_resolver(character_bins)
+    df["speaker"] = resolver.resolve(df["speaker"], fallback='lower')
+    return df
+
 def script_to_network(script, character_bins):
     # Given a Hannibal script as a string, make a graph frame based on characters who appear in the same scene as one another
     # Also include character_bins path for binning
-    cbins = load_character_bins(character_bins)
-
-    script = _clean_screenplay(script)
-    #print(len(script))
-    scenes = _get_scenes(script)
-
-    scene_dialogs = [screenplay_to_dialog_table(s) for s in scenes]
-    #print("boink", scenes[1])
-
-    for scene in scene_dialogs:
-        scene['speaker'] = scene['speaker'].map(lambda x: cbins[x.lower()] if x.lower() in cbins else x.title())
+    resolver = characters.get_resolver(character_bins)
 
-    edges = defaultdict(Counter)
+    scenes, _ = screenplay_to_scene_table(script)
+    scenes['speaker'] = resolver.resolve(scenes['speaker'], fallback='title')
 
-    for scene in scene_dialogs:
-        characters = scene['speaker'].unique()
-        characters = sorted(characters)
-        pairs = combinations(characters, 2)
+    # Pair up every two distinct speakers within a scene, in sorted order
+    speakers = scenes[['scene_id', 'speaker']].drop_duplicates().sort_values(['scene_id', 'speaker'])
+    pairs = speakers.merge(speakers, on='scene_id', suffixes=('_source', '_target'))
+    pairs = pairs[pairs['speaker_source'] < pairs['speaker_target']]
 
-        for pair in pairs:
-            edges[pair[0]][pair[1]] += 1
-
-    # Now just make the edges dict into a dataframe
-    data = {"source": [], "target": [], "type": [], "weight": []}
-
-    for char, edge in edges.items():
-        for char2, weight in edge.items():
-            data["source"].append(char)
-            data["target"].append(char2)
-            data["type"].append("undirected")
-            data["weight"].append(weight)
-
-    df = pd.DataFrame(data)
+    edges = network.EdgeAccumulator()
+    edges.add_pairs(pairs['speaker_source'], pairs['speaker_target'])
+    df = edges.to_frame()
     return df
 
+def scripts_to_temporal_network(scripts, character_bins, labels=None):
+    # Given a list of Hannibal scripts as strings, in episode order, return a network.TemporalNetwork with
+    # one step per episode, from which per-episode deltas and cumulative "as of episode k" networks can be had.
+    # labels: optional name for each episode, e.g. the file name
+    temporal = network.TemporalNetwork()
+    if labels is None:
+        labels = range(len(scripts))
+    for script, label in zip(scripts, labels):
+        temporal.add_step(script_to_network(script, character_bins), label)
+    return temporal
+
 def fandom_network(fandom, character_bins):
-    # Given the complete dict of a fandom, return the graph frame of characters co-occurring in stories together
-    cbins = load_character_bins(character_bins)
-    edges = defaultdict(Counter)
-
-    for fic in fandom:
-        characters = sorted(fic['characters'])
-        characters = map(lambda x: cbins[x.lower()] if x.lower() in cbins else x, characters)
-        pairs = combinations(characters, 2)
-
-        for pair in pairs:
-            edges[pair[0]][pair[1]] += 1
-
-    # Now just make the edges dict into a dataframe
-    data = {"source": [], "target": [], "type": [], "weight": []}
-
-    for char, edge in edges.items():
-        for char2, weight in edge.items():
-            data["source"].append(char)
-            data["target"].append(char2)
-            data["type"].append("undirected")
-            data["weight"].append(weight)
-
-    df = pd.DataFrame(data)
-    return df
\ No newline at end of file
+    # Given the complete dict of a fandom, return the graph frame of characters co-occurring in stories together.
+    # Edges go from the character whose tagged name sorts first to the other, as in each fic's sorted character
+    # list. Rows are sorted by source and target.
+    resolver = characters.get_resolver(character_bins)
+
+    # Fic x character incidence matrix over the tagged names, sorted so that i < j means name i sorts first.
+    # A name tagged twice in one fic counts twice.
+    lengths = np.fromiter((len(fic['characters']) for fic in fandom), dtype=np.int64, count=len(fandom))
+    tags = pd.Series([c for fic in fandom for c in fic['characters']], dtype=object)
+    if len(tags) == 0:
+        return pd.DataFrame({"source": [], "target": [], "type": [], "weight": []})
+    tag_codes, tag_names = pd.factorize(tags, sort=True)
+    fics = np.repeat(np.arange(len(fandom)), lengths)
+    X = sparse.csr_matrix((np.ones(len(tag_codes), dtype=np.int64), (fics, tag_codes)),
+                          shape=(len(fandom), len(tag_names)))
+
+    # Every pair of tags within a fic once: the upper triangle of X^T X, and n(n-1)/2 on the diagonal for
+    # names tagged n times in a fic
+    cooc = sparse.triu(X.T @ X, k=1).tocoo()
+    repeats = (np.asarray(X.multiply(X).sum(axis=0)).ravel() - np.asarray(X.sum(axis=0)).ravel()) // 2
+    repeated = np.flatnonzero(repeats)
+    source = np.concatenate([cooc.row, repeated])
+    target = np.concatenate([cooc.col, repeated])
+    weight = np.concatenate([cooc.data, repeats[repeated]])
+
+    # Bin the tagged names and add up pairs that land on the same edge
+    names = resolver.resolve(tag_names, fallback='keep')
+    edges = network.EdgeAccumulator()
+    edges.add_pairs(names[source], names[target], weight)
+
+    df = edges.to_frame()
+    df = df.sort_values(["source", "target"], ignore_index=True)
+    return df